@@ -0,0 +1,105 @@
+"""
+Micro-benchmark of the cost of logging on the request path
+
+Times the log calls that creating a wishlist makes (the request line, the
+payload, the result) with logging turned off, with a StreamHandler that
+writes each record as it is logged (as the app did before), and with the
+queue handler of service/logs.py. Records go to a temporary file, which
+--write-delay-ms can slow down to stand in for a blocked stdout pipe or a
+busy log shipper. Between requests the benchmark sleeps for --request-ms,
+as a worker would while it waits on Mongo. No database is needed.
+
+    python -m benchmarks.logs --calls 5000 --write-delay-ms 0.2
+"""
+import argparse
+import logging
+import statistics
+import tempfile
+import time
+
+from service import logs
+
+PAYLOAD = {
+    "name": "wishlist",
+    "customer_id": "customer 1",
+    "isPublic": True,
+    "items": [{"item_id": i, "item_name": "item {}".format(i), "description": "x" * 200} for i in range(50)],
+}
+
+
+class SlowFile:
+    """A file whose writes take at least a given time"""
+
+    def __init__(self, file, delay: float):
+        self.file = file
+        self.delay = delay
+
+    def write(self, text):
+        if self.delay:
+            time.sleep(self.delay)
+        return self.file.write(text)
+
+    def flush(self):
+        self.file.flush()
+
+
+def log_request(logger):
+    """Logs what creating a wishlist logged"""
+    logger.info("Request for creating a new wishlist")
+    logger.info("deserialize(%s)", PAYLOAD)
+    logger.info("Wishlist with id [%s] saved!", "6248b8a2c3e4a1f0b9d2e7c1")
+
+
+def measure(logger, calls: int, request_ms: float) -> dict:
+    """Returns the latency percentiles of the log calls of a request, in microseconds"""
+    timings = []
+    for _ in range(calls):
+        time.sleep(request_ms / 1000)
+        started = time.perf_counter()
+        log_request(logger)
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    return {
+        "mean": statistics.fmean(timings),
+        "p50": timings[len(timings) // 2],
+        "p99": timings[int(len(timings) * 0.99)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=5000, help="requests to log")
+    parser.add_argument("--request-ms", type=float, default=1, help="time each request waits on Mongo")
+    parser.add_argument("--write-delay-ms", type=float, default=0, help="time each write to the log takes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryFile("w") as file:
+        output = SlowFile(file, args.write_delay_ms / 1000)
+        logger = logging.getLogger("benchmarks.logs")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+        logging.disable(logging.CRITICAL)
+        results = {"disabled": measure(logger, args.calls, args.request_ms)}
+        logging.disable(logging.NOTSET)
+
+        stream = logging.StreamHandler(output)
+        stream.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s in %(name)s: %(message)s"))
+        logger.handlers = [stream]
+        results["stream"] = measure(logger, args.calls, args.request_ms)
+
+        handler = logs.create_handler(output)
+        logger.handlers = [handler]
+        results["queue"] = measure(logger, args.calls, args.request_ms)
+        started = time.perf_counter()
+        handler.stop()
+        drained = time.perf_counter() - started
+
+    print("{:<10} {:>10} {:>10} {:>10}".format("handler", "mean us", "p50 us", "p99 us"))
+    for name, result in results.items():
+        print("{:<10} {:10.1f} {:10.1f} {:10.1f}".format(name, result["mean"], result["p50"], result["p99"]))
+    print("queue handler dropped {} records, took {:.2f} s to write the rest".format(handler.dropped, drained))
+
+
+if __name__ == "__main__":
+    main()
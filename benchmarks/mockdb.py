@@ -0,0 +1,52 @@
+"""
+Runs the benchmarks against mongomock instead of a Mongo server
+
+With an in-memory database the numbers show the cost of the service itself
+rather than of the database and the network. load.py and startup.py take
+--mongomock; a server for throughput.py is started through this module,
+which patches pymongo before running the given module as __main__:
+
+    python -m benchmarks.mockdb gunicorn service:app
+
+Every client in a process shares one in-memory store, so the data seeded by
+one connection is seen by the others. Needs the mongomock package.
+"""
+import runpy
+import sys
+
+
+def install():
+    """Makes every MongoClient created from now on a mongomock client"""
+    try:
+        import mongomock  # pylint: disable=import-outside-toplevel
+        from mongomock.store import ServerStore  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        raise SystemExit("--mongomock needs the mongomock package: pip install mongomock")
+    import pymodm.connection  # pylint: disable=import-outside-toplevel
+    import pymongo  # pylint: disable=import-outside-toplevel
+
+    store = ServerStore()
+
+    class MockClient(mongomock.MongoClient):
+        """A mongomock client on the shared store"""
+
+        def __init__(self, *args, **kwargs):
+            # pymodm names itself as the driver, which mongomock does not take
+            kwargs.pop("driver", None)
+            kwargs.setdefault("_store", store)
+            super().__init__(*args, **kwargs)
+
+    pymongo.MongoClient = MockClient
+    pymodm.connection.MongoClient = MockClient
+
+
+def main():
+    if len(sys.argv) < 2:
+        raise SystemExit(__doc__)
+    install()
+    del sys.argv[0]
+    runpy.run_module(sys.argv[0], run_name="__main__", alter_sys=True)
+
+
+if __name__ == "__main__":
+    main()
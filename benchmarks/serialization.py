@@ -0,0 +1,84 @@
+"""
+Micro-benchmark of the Wishlist serialization paths
+
+Compares the model path used before (build pymodm instances, serialize
+them, then marshal the result with flask-restx) with the fast path that
+serializes raw documents straight into the response schema. It checks
+that both give the same output before timing them, then times encoding
+the result with the json module, as flask-restx did, and with the
+representation in service/representations.py. No database is needed.
+
+    python -m benchmarks.serialization --wishlists 1000 --items 20
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from service.models import Item, Wishlist
+from service.representations import dumps
+from service.routes import api, wishlist_model
+
+
+def make_documents(wishlists: int, items: int):
+    """Builds raw Item and Wishlist documents as Mongo would return them"""
+    start = datetime(2022, 4, 2, 12, 45)
+    item_documents = [
+        {"_id": i, "item_name": "item {}".format(i), "price": 100 + i, "discount": i % 100,
+         "description": "description {}".format(i), "date_added": start + timedelta(minutes=i)}
+        for i in range(wishlists * items // 2 or 1)
+    ]
+    wishlist_documents = [
+        {"_id": ObjectId(), "name": "wishlist {}".format(w), "customer_id": "customer {}".format(w % 50),
+         "items": [(w * items + i) % len(item_documents) for i in range(items)], "isPublic": w % 2 == 0}
+        for w in range(wishlists)
+    ]
+    return item_documents, wishlist_documents
+
+
+def model_path(item_documents, wishlist_documents):
+    """Serializes through pymodm instances and flask-restx marshalling"""
+    items = {document["_id"]: Item.from_document(document) for document in item_documents}
+    results = [Wishlist.from_document(document).serialize(items) for document in wishlist_documents]
+    return api.marshal(results, wishlist_model)
+
+
+def fast_path(item_documents, wishlist_documents):
+    """Serializes the raw documents straight into the response schema"""
+    items = {document["_id"]: Item.serialize_document(document) for document in item_documents}
+    return [Wishlist.serialize_document(document, items) for document in wishlist_documents]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--wishlists", type=int, default=1000)
+    parser.add_argument("--items", type=int, default=20, help="items per wishlist")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    item_documents, wishlist_documents = make_documents(args.wishlists, args.items)
+    expected = [dict(result) for result in model_path(item_documents, wishlist_documents)]
+    for result in expected:
+        result["items"] = [dict(item) for item in result["items"]]
+    assert expected == fast_path(item_documents, wishlist_documents), "the paths disagree"
+
+    model = min(timeit.repeat(lambda: model_path(item_documents, wishlist_documents), number=1, repeat=args.repeat))
+    fast = min(timeit.repeat(lambda: fast_path(item_documents, wishlist_documents), number=1, repeat=args.repeat))
+    print("{} wishlists x {} items: outputs are identical".format(args.wishlists, args.items))
+    print("model path: {:8.1f} ms".format(model * 1000))
+    print("fast path:  {:8.1f} ms".format(fast * 1000))
+    print("speedup:    {:8.1f}x".format(model / fast))
+
+    results = fast_path(item_documents, wishlist_documents)
+    assert json.loads(dumps(results)) == results, "the encoders disagree"
+    stdlib = min(timeit.repeat(lambda: json.dumps(results) + "\n", number=1, repeat=args.repeat))
+    encoder = min(timeit.repeat(lambda: dumps(results) + b"\n", number=1, repeat=args.repeat))
+    print("json.dumps: {:8.1f} ms".format(stdlib * 1000))
+    print("dumps:      {:8.1f} ms".format(encoder * 1000))
+    print("speedup:    {:8.1f}x".format(stdlib / encoder))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Startup benchmark
+
+Measures, in fresh interpreters, how long it takes to import the service
+package, to create the Flask app and to answer the first request, which
+is what a cold start on Cloud Foundry or a new test process pays:
+
+    python -m benchmarks.startup --runs 10
+
+--mongomock answers the first request from an in-memory database, see
+benchmarks/mockdb.py; mongomock is imported before the timings start.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# runs in the child interpreter, it also works on trees without create_app
+PROBE = """
+import json, sys, time
+if "--mongomock" in sys.argv:
+    from benchmarks import mockdb
+    mockdb.install()
+started = time.perf_counter()
+import service
+imported = time.perf_counter()
+create_app = getattr(service, "create_app", None)
+app = create_app() if create_app else service.app
+created = time.perf_counter()
+response = app.test_client().get(sys.argv[1])
+answered = time.perf_counter()
+print(json.dumps({
+    "status": response.status_code,
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "first_request_ms": (answered - created) * 1000,
+    "total_ms": (answered - started) * 1000,
+}))
+"""
+
+PHASES = ("import_ms", "create_app_ms", "first_request_ms", "total_ms")
+
+
+def probe(path: str, mongomock: bool = False) -> dict:
+    """Starts one interpreter and returns its timings"""
+    command = [sys.executable, "-c", PROBE, path] + (["--mongomock"] if mongomock else [])
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(path: str, runs: int, mongomock: bool = False) -> dict:
+    """Returns the median of every phase over a number of cold starts"""
+    probes = [probe(path, mongomock) for _ in range(runs)]
+    statuses = {result["status"] for result in probes}
+    if statuses != {200}:
+        raise SystemExit("GET {} answered {}".format(path, sorted(statuses)))
+    return {phase: statistics.median(result[phase] for result in probes) for phase in PHASES}
+
+
+def main():
+    """Parses the arguments and prints the startup timings"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--path", default="/wishlists?limit=20", help="The first request to send")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", help="Save the timings as JSON")
+    parser.add_argument("--compare", help="Timings saved by an earlier run to compare with")
+    parser.add_argument("--mongomock", action="store_true", help="Use an in-memory mongomock database")
+    args = parser.parse_args()
+
+    results = run(args.path, args.runs, args.mongomock)
+    before = {}
+    if args.compare:
+        with open(args.compare) as file:
+            before = json.load(file)
+    for phase in PHASES:
+        line = "{:<18} {:8.1f} ms".format(phase, results[phase])
+        if phase in before:
+            line += "  (was {:.1f} ms, {:+.1f})".format(before[phase], results[phase] - before[phase])
+        print(line)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
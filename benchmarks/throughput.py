@@ -0,0 +1,68 @@
+"""
+Throughput benchmark of a running server
+
+Sends GET requests from a number of concurrent clients, each holding a
+keep-alive connection, and reports requests per second. Start the server
+with the configuration under test first, e.g.
+
+    gunicorn service:app
+    python -m benchmarks.throughput --url http://localhost:8000/wishlists?limit=20
+"""
+import argparse
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def client(url, deadline: float, counts: list, index: int):
+    """Requests url over one connection until the deadline"""
+    parts = urlsplit(url)
+    path = parts.path + ("?" + parts.query if parts.query else "")
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+    ok = errors = 0
+    while time.monotonic() < deadline:
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            if response.status < 400:
+                ok += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+    connection.close()
+    counts[index] = (ok, errors)
+
+
+def run(url: str, concurrency: int, duration: float) -> dict:
+    """Runs the clients for duration seconds and returns the totals"""
+    counts = [(0, 0)] * concurrency
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=client, args=(url, deadline, counts, i)) for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ok = sum(count[0] for count in counts)
+    errors = sum(count[1] for count in counts)
+    return {"requests": ok, "errors": errors, "per_second": ok / duration}
+
+
+def main():
+    """Parses the arguments and prints the throughput"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", default="http://localhost:8000/wishlists?limit=20")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+    result = run(args.url, args.concurrency, args.duration)
+    print("{requests} requests, {errors} errors, {per_second:.0f} requests/s".format(**result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Gunicorn configuration for the wishlist service
+
+Gunicorn reads this file from the working directory, so the Procfile only
+names the app. Workers are sized from the CPU and memory the container is
+actually allowed to use (cgroup limits, or MEMORY_LIMIT on Cloud Foundry)
+rather than from the host, and every setting can be overridden from the
+environment:
+
+* GUNICORN_WORKER_CLASS: sync, gthread (default) or gevent
+* GUNICORN_WORKERS, GUNICORN_THREADS: skip the autotuning
+* GUNICORN_WORKER_MEMORY_MB: memory budgeted per worker (default 48)
+* GUNICORN_KEEPALIVE, GUNICORN_TIMEOUT, GUNICORN_MAX_REQUESTS
+
+Nothing from the service is imported here: the Mongo client is created in
+each worker after the fork (see post_worker_init), and the gevent worker
+must be able to patch the standard library before pymongo is imported.
+"""
+import multiprocessing
+import os
+
+# memory the master process and the interpreter need before any worker
+MASTER_MEMORY_MB = 32
+# pymongo's default is 100 but service/database.py caps each worker at 20
+DEFAULT_MAX_POOL_SIZE = 20
+
+_UNITS = {"k": 1 / 1024, "m": 1, "g": 1024, "t": 1024 * 1024}
+
+
+def _read(path: str):
+    """Returns the stripped contents of a file, or None if it is missing"""
+    try:
+        with open(path) as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit() -> int:
+    """Returns the number of CPUs this container may use"""
+    quota = _read("/sys/fs/cgroup/cpu.max")
+    if quota and not quota.startswith("max"):
+        limit, period = quota.split()
+        return max(1, int(int(limit) / int(period)))
+    limit = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if limit and period and int(limit) > 0:
+        return max(1, int(int(limit) / int(period)))
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return multiprocessing.cpu_count()
+
+
+def memory_limit_mb():
+    """Returns the memory this container may use in MB, or None if unlimited"""
+    # Cloud Foundry sets e.g. MEMORY_LIMIT=128m
+    limit = os.getenv("MEMORY_LIMIT")
+    if limit:
+        limit = limit.strip().lower()
+        if limit[-1] in _UNITS:
+            return int(float(limit[:-1]) * _UNITS[limit[-1]])
+        return int(limit) // (1024 * 1024)
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        limit = _read(path)
+        # cgroup v1 reports "unlimited" as a huge number
+        if limit and limit != "max" and int(limit) < 2 ** 60:
+            return int(limit) // (1024 * 1024)
+    return None
+
+
+def autotune(cpus: int, memory_mb=None, worker_class: str = None) -> dict:
+    """Chooses the worker class, workers and threads for the given limits
+
+    The service spends most of each request waiting on Mongo, so the default
+    is the gthread worker: (2 x CPUs) + 1 processes as gunicorn recommends,
+    as many as fit in memory, each running threads up to the size of its
+    Mongo connection pool so that no thread waits for a connection.
+    """
+    worker_class = worker_class or os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+    workers = 2 * cpus + 1
+    if memory_mb is not None:
+        per_worker = int(os.getenv("GUNICORN_WORKER_MEMORY_MB", "48"))
+        workers = min(workers, (memory_mb - MASTER_MEMORY_MB) // per_worker)
+    workers = int(os.getenv("GUNICORN_WORKERS", max(1, workers)))
+
+    pool_size = int(os.getenv("MONGO_MAX_POOL_SIZE", DEFAULT_MAX_POOL_SIZE))
+    threads = 1
+    if worker_class == "gthread":
+        threads = min(4 * cpus, pool_size)
+    threads = int(os.getenv("GUNICORN_THREADS", max(1, threads)))
+    return {
+        "worker_class": worker_class,
+        "workers": workers,
+        "threads": threads,
+        # gevent: greenlets beyond the pool wait up to waitQueueTimeoutMS
+        "worker_connections": pool_size * 5,
+    }
+
+
+_tuned = autotune(cpu_limit(), memory_limit_mb())
+
+bind = "0.0.0.0:{}".format(os.getenv("PORT", "8000"))
+worker_class = _tuned["worker_class"]
+workers = _tuned["workers"]
+threads = _tuned["threads"]
+worker_connections = _tuned["worker_connections"]
+
+# behind the Cloud Foundry router, which reuses its connections
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 30
+# recycle workers now and then so that slow leaks cannot build up, with
+# jitter so that they do not all restart at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def when_ready(server):
+    """Logs the tuning once the master is up"""
+    server.log.info(
+        "Running %d %s worker(s) with %d thread(s) on %d CPU(s) and %s MB",
+        workers, worker_class, threads, cpu_limit(), memory_limit_mb() or "unlimited",
+    )
+
+
+def post_worker_init(worker):
+    """Gives each worker its own Mongo connection pool, right after the fork
+
+    This runs once the worker has initialized, which for gevent is after
+    the standard library was patched, so pymongo is imported here and not
+    in post_fork. The worker then starts dropping the cache entries that
+    other workers write to.
+    """
+    # pylint: disable=import-outside-toplevel
+    from service.database import init_db
+    from service.invalidation import invalidator
+
+    init_db()
+    invalidator.start()
+    worker.log.info("Worker %d connected to the database", worker.pid)
@@ -1,7 +1,46 @@
-from flask import Flask
+"""
+Package: service
 
-app = Flask(__name__)
+create_app builds the Flask app of the service. service.app, which gunicorn
+and the flask command load, is only created the first time it is used, so
+importing a module of the package (e.g. the models in a CLI tool or a test)
+does not build the routes and their API docs. Nothing connects to Mongo
+until the first request.
+"""
+from flask import Flask
 
-# Import the routes After the Flask app is created
+# Mongo command listeners must be registered before any client is created
 # pylint: disable=wrong-import-position, cyclic-import
-from service import routes, models,error_handlers
\ No newline at end of file
+from service import logs, metrics, querylog, reads  # noqa: F401
+
+
+def create_app(config: dict = None) -> Flask:
+    """Creates the Flask app of the service
+
+    :param config: settings added to the app config, e.g. DATABASE_URI to
+        connect to a database other than the one in the environment
+    """
+    app = Flask(__name__)
+    # a 404 from a route is about the resource, not the URL, and the ASGI
+    # reads answer it with the same body
+    app.config["ERROR_404_HELP"] = False
+    app.config.from_mapping(config or {})
+    logs.init_app(app)
+
+    # Measure requests before any other hook runs
+    metrics.init_app(app)
+    reads.init_app(app)
+
+    from service import routes, error_handlers, commands
+    routes.init_app(app)
+    error_handlers.init_app(app)
+    commands.init_app(app)
+    return app
+
+
+def __getattr__(name):
+    """Creates service.app on first use"""
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
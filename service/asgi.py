@@ -0,0 +1,351 @@
+"""
+Module: asgi
+
+An ASGI entry point for the service, run with e.g.
+
+    uvicorn service.asgi:app
+    gunicorn -k uvicorn.workers.UvicornWorker service.asgi:app
+
+The reads that make up most of the traffic are served by async handlers on
+the motor driver, so a worker waiting on Mongo keeps serving other requests
+instead of holding a thread, and the Items of a page of Wishlists are
+fetched with concurrent queries. They answer with the same JSON, status
+codes and headers as the Flask routes and share the serializers in
+models.py. Every other request, and any read these handlers cannot parse,
+goes to the Flask app through asgiref, so writes and their validation,
+caching and revisions stay in one place.
+
+The async reads go straight to Mongo rather than through the Wishlist
+cache, and are not counted in /metrics. They follow the read preference
+of their Flask route (see reads.py), but reads that carry a causal token
+are left to the Flask app, which reads them in a causally consistent
+session.
+"""
+import asyncio
+import re
+from contextvars import ContextVar
+from urllib.parse import parse_qs, urlencode
+
+from asgiref.wsgi import WsgiToAsgi
+from bson import ObjectId
+from bson.errors import InvalidId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.read_preferences import ReadPreference
+from werkzeug.http import http_date, is_resource_modified, quote_etag
+
+from service import app as flask_app
+from service import reads, status
+from service.database import database_uri, init_db, pool_options
+from service.models import Item, Wishlist
+from service.invalidation import invalidator
+from service.reconciler import reconciler
+from service.representations import dumps
+
+# the most Item ids looked up by one query, bigger pages are split up and
+# looked up concurrently
+ITEM_BATCH_SIZE = 100
+
+# the read preference of the request being handled, set for each task
+read_preference = ContextVar("read_preference", default=None)
+
+
+class NotHandled(Exception):
+    """Raised by a handler that leaves the request to the Flask app"""
+
+
+class AsyncStore:
+    """The motor collections of the models, connected on first use"""
+
+    def __init__(self):
+        self.client = None
+
+    def connect(self):
+        """Creates the client, which must happen inside the event loop"""
+        if self.client is None:
+            self.client = AsyncIOMotorClient(database_uri(), **pool_options())
+        return self.client
+
+    def collection(self, model):
+        """Returns the collection of a model, with the read preference of the request"""
+        collection = self.connect().get_database()[model._mongometa.collection_name]
+        preference = read_preference.get()
+        if preference is None or preference is ReadPreference.PRIMARY:
+            return collection
+        return collection.with_options(read_preference=preference)
+
+    async def find_items(self, item_ids) -> dict:
+        """Returns the serialized Items with the given ids, by id"""
+        item_ids = list(item_ids)
+        batches = [item_ids[i:i + ITEM_BATCH_SIZE] for i in range(0, len(item_ids), ITEM_BATCH_SIZE)]
+        found = await asyncio.gather(*(
+            self.collection(Item).find({"_id": {"$in": batch}}).to_list(None) for batch in batches
+        ))
+        return {
+            document["_id"]: Item.serialize_document(document)
+            for documents in found for document in documents
+        }
+
+    async def serialize_wishlists(self, documents: list) -> list:
+        """Serializes raw Wishlist documents, resolving their Items concurrently"""
+        item_ids = {
+            i for document in documents if Wishlist.embedded_items(document) is None
+            for i in document.get("items") or ()
+        }
+        items = await self.find_items(item_ids) if item_ids else {}
+        return [Wishlist.serialize_document(document, items) for document in documents]
+
+    async def find_wishlist(self, wishlist_id: str, projection: dict = None):
+        """Returns the raw Wishlist document with an id, or None"""
+        try:
+            wishlist_id = ObjectId(wishlist_id)
+        except (InvalidId, TypeError):
+            return None
+        return await self.collection(Wishlist).find_one({"_id": wishlist_id}, projection)
+
+
+store = AsyncStore()
+
+
+######################################################################
+# Responses
+######################################################################
+class JSONResponse:
+    """A response with a JSON body, encoded like those of the Flask routes"""
+
+    def __init__(self, data, status_code: int = status.HTTP_200_OK, headers: dict = None):
+        self.body = b"" if data is None else dumps(data) + b"\n"
+        self.status_code = status_code
+        self.headers = dict(headers or {})
+        if data is not None:
+            self.headers["Content-Type"] = "application/json"
+        self.headers["Content-Length"] = str(len(self.body))
+
+    async def __call__(self, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                        for name, value in self.headers.items()],
+        })
+        await send({"type": "http.response.body", "body": self.body})
+
+
+def not_found(message: str) -> JSONResponse:
+    """Returns a 404 like the abort of the Flask routes"""
+    return JSONResponse({"message": message}, status.HTTP_404_NOT_FOUND)
+
+
+def version_headers(document: dict) -> dict:
+    """Returns the ETag and Last-Modified headers of a raw Wishlist document"""
+    headers = {"ETag": quote_etag(str(document.get("revision") or 0))}
+    if document.get("last_modified"):
+        headers["Last-Modified"] = http_date(document["last_modified"])
+    return headers
+
+
+def is_modified(request, document: dict) -> bool:
+    """Checks the conditional headers of a request against a Wishlist"""
+    environ = {"REQUEST_METHOD": "GET"}
+    for name in ("if-none-match", "if-modified-since"):
+        if name in request.headers:
+            environ["HTTP_" + name.upper().replace("-", "_")] = request.headers[name]
+    return is_resource_modified(
+        environ, etag=str(document.get("revision") or 0), last_modified=document.get("last_modified")
+    )
+
+
+class Request:
+    """What the handlers need to know about an ASGI request"""
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.path = scope["path"]
+        self.headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        self.args = {
+            name: values[-1]
+            for name, values in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()
+        }
+
+    def arg_natural(self, name: str) -> int:
+        """Returns a non-negative integer argument, 0 if it is missing"""
+        value = self.args.get(name)
+        if value is None:
+            return 0
+        if not value.isdigit():
+            raise NotHandled()
+        return int(value)
+
+    def url(self, query: dict) -> str:
+        """Returns the absolute URL of this path with a query string"""
+        host = self.headers.get("host", "localhost")
+        return "{}://{}{}?{}".format(self.scope.get("scheme", "http"), host, self.path, urlencode(query))
+
+
+def next_page_headers(request, args: dict, results: list, key: str) -> dict:
+    """Returns a Link header pointing at the next page of a full page of results"""
+    if not args["limit"] or len(results) < args["limit"]:
+        return {}
+    query = {name: value for name, value in args.items() if value}
+    query["after"] = results[-1][key]
+    return {"Link": '<{}>; rel="next"'.format(request.url(query))}
+
+
+######################################################################
+# Handlers
+######################################################################
+async def list_wishlists(request):
+    """GET /wishlists"""
+    args = {
+        "limit": request.arg_natural("limit"),
+        "after": request.args.get("after"),
+        "customer_id": request.args.get("customer_id"),
+        "name": request.args.get("name"),
+    }
+    query = {}
+    if args["customer_id"]:
+        query["customer_id"] = args["customer_id"]
+    elif args["name"]:
+        query["name"] = args["name"]
+    cursor = store.collection(Wishlist).find(query)
+    if args["limit"] or args["after"]:
+        if args["after"] is not None:
+            try:
+                query["_id"] = {"$gt": ObjectId(args["after"])}
+            except (InvalidId, TypeError):
+                raise NotHandled()
+        cursor = store.collection(Wishlist).find(query).sort("_id", 1).limit(args["limit"])
+    results = await store.serialize_wishlists(await cursor.to_list(None))
+    return JSONResponse(results, headers=next_page_headers(request, args, results, "_id"))
+
+
+async def list_items(request):
+    """GET /items"""
+    args = {"limit": request.arg_natural("limit"), "after": request.args.get("after")}
+    query = {}
+    cursor = store.collection(Item).find(query)
+    if args["limit"] or args["after"]:
+        if args["after"] is not None:
+            if not args["after"].lstrip("-").isdigit():
+                raise NotHandled()
+            query["_id"] = {"$gt": int(args["after"])}
+        cursor = store.collection(Item).find(query).sort("_id", 1).limit(args["limit"])
+    results = [Item.serialize_document(document) for document in await cursor.to_list(None)]
+    return JSONResponse(results, headers=next_page_headers(request, args, results, "item_id"))
+
+
+async def get_wishlist(request, wishlist_id, items_only: bool = False):
+    """GET /wishlists/<wishlist_id> and GET /wishlists/<wishlist_id>/items"""
+    document = await store.find_wishlist(wishlist_id)
+    if document is None:
+        return not_found("Wishlist with id '{}' was not found.".format(wishlist_id))
+    headers = version_headers(document)
+    if not is_modified(request, document):
+        return JSONResponse(None, status.HTTP_304_NOT_MODIFIED, headers)
+    result = (await store.serialize_wishlists([document]))[0]
+    return JSONResponse(result["items"] if items_only else result, headers=headers)
+
+
+async def get_wishlist_items(request, wishlist_id):
+    """GET /wishlists/<wishlist_id>/items"""
+    return await get_wishlist(request, wishlist_id, items_only=True)
+
+
+async def get_wishlist_item(request, wishlist_id, item_id):
+    """GET /wishlists/<wishlist_id>/items/<item_id>"""
+    item_id = int(item_id)
+    document = await store.find_wishlist(wishlist_id, {"items": 1})
+    if document is None:
+        return not_found("Wishlist with id '{}' was not found.".format(wishlist_id))
+    item = None
+    if item_id in (document.get("items") or ()):
+        item = await store.collection(Item).find_one({"_id": item_id})
+    if item is None:
+        return not_found(
+            "Item with id '{}' was not found from wishlist with id '{}'.".format(item_id, wishlist_id)
+        )
+    return JSONResponse(Item.serialize_document(item))
+
+
+async def list_customer_wishlists(request, customer_id):
+    """GET /customers/<customer_id>/wishlists"""
+    cursor = store.collection(Wishlist).find({"customer_id": customer_id}).sort("_id", 1)
+    return JSONResponse(await store.serialize_wishlists(await cursor.to_list(None)))
+
+
+# pattern, handler and the rule of the Flask route it stands in for
+ROUTES = [
+    (re.compile(r"^/wishlists/?$"), list_wishlists, "/wishlists"),
+    (re.compile(r"^/items/?$"), list_items, "/items"),
+    (re.compile(r"^/wishlists/(?P<wishlist_id>[^/:]+)$"), get_wishlist, "/wishlists/<wishlist_id>"),
+    (re.compile(r"^/wishlists/(?P<wishlist_id>[^/:]+)/items$"), get_wishlist_items,
+     "/wishlists/<wishlist_id>/items"),
+    (re.compile(r"^/wishlists/(?P<wishlist_id>[^/:]+)/items/(?P<item_id>\d+)$"), get_wishlist_item,
+     "/wishlists/<string:wishlist_id>/items/<int:item_id>"),
+    (re.compile(r"^/customers/(?P<customer_id>.+)/wishlists$"), list_customer_wishlists,
+     "/customers/<path:customer_id>/wishlists"),
+]
+
+
+class Application:
+    """Serves the async reads and passes everything else to the Flask app"""
+
+    def __init__(self, wsgi_app):
+        self.fallback = WsgiToAsgi(wsgi_app)
+
+    def handler(self, scope: dict):
+        """Returns the async handler of a request, its path arguments and read preference"""
+        if scope["method"] != "GET":
+            return None, None, None
+        request = Request(scope)
+        if "application/x-ndjson" in request.headers.get("accept", ""):
+            return None, None, None
+        for pattern, handler, rule in ROUTES:
+            match = pattern.match(scope["path"])
+            if match:
+                preference = reads.settings.preference("GET", rule)
+                if preference is not ReadPreference.PRIMARY and reads.settings.causal \
+                        and reads.TOKEN_HEADER.lower() in request.headers:
+                    return None, None, None
+                return handler, match.groupdict(), preference
+        return None, None, None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        handler, kwargs, preference = self.handler(scope) if scope["type"] == "http" else (None, None, None)
+        if handler is not None:
+            read_preference.set(preference)
+            try:
+                response = await handler(Request(scope), **kwargs)
+            except NotHandled:
+                pass
+            else:
+                await response(send)
+                return
+        await self.fallback(scope, receive, send)
+
+    @staticmethod
+    async def lifespan(receive, send):
+        """Connects to Mongo when the server starts
+
+        The Flask app connects on its first request, but the reconciler and
+        the cache invalidator must run in this worker even if every request
+        is an async read.
+        """
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                store.connect()
+                init_db()
+                reconciler.start()
+                invalidator.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if store.client is not None:
+                    store.client.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+app = Application(flask_app)
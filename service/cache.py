@@ -0,0 +1,170 @@
+"""
+Module: cache
+
+Read-through cache for hot Wishlists and Items. The backend is chosen from the
+environment (12 factor):
+
+* CACHE_BACKEND: "memory" (default) for an in-process LRU, "mongo" to share
+  entries between instances through a Mongo collection, "none" to disable
+* CACHE_TTL: seconds an entry stays fresh (default 10), entries of the
+  in-process LRU are also dropped when another instance writes them, see
+  service/invalidation.py
+* CACHE_MAX_SIZE: the most entries the in-process LRU keeps (default 1024)
+"""
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, IndexModel
+from pymodm.connection import _get_db
+
+
+class NullCache:
+    """A cache that never holds anything"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns the value cached under key or None"""
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        """Caches a value under key"""
+
+    def delete(self, *keys):
+        """Drops the values cached under keys"""
+
+    def clear(self):
+        """Drops every cached value"""
+
+    def size(self) -> int:
+        """Returns the number of cached values"""
+        return 0
+
+    def stats(self) -> dict:
+        """Returns the counters used for monitoring"""
+        return {
+            "backend": type(self).__name__,
+            "size": self.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class LRUCache(NullCache):
+    """An in-process cache that evicts the least recently used entries
+
+    Values are copied on the way in and out so that callers can mutate
+    what they get back without corrupting the cache.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 10, clock=time.monotonic):
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class MongoCache(NullCache):
+    """A cache shared by every instance, kept in a Mongo collection
+
+    Mongo's TTL monitor removes expired entries, so evictions are not
+    counted here.
+    """
+
+    def __init__(self, ttl: float = 10, collection_name: str = "cache"):
+        super().__init__()
+        self.ttl = ttl
+        self.collection_name = collection_name
+        self._indexed = False
+
+    @property
+    def collection(self):
+        """The collection holding the entries, with its TTL index"""
+        collection = _get_db()[self.collection_name]
+        if not self._indexed:
+            collection.create_indexes([IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0)])
+            self._indexed = True
+        return collection
+
+    def get(self, key):
+        document = self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+        if document is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return document["value"]
+
+    def set(self, key, value):
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        self.collection.replace_one(
+            {"_id": key}, {"_id": key, "value": value, "expires_at": expires_at}, upsert=True
+        )
+
+    def delete(self, *keys):
+        if keys:
+            self.collection.delete_many({"_id": {"$in": list(keys)}})
+
+    def clear(self):
+        self.collection.delete_many({})
+
+    def size(self) -> int:
+        return self.collection.count_documents({})
+
+
+def create_cache(backend: str = None):
+    """Creates the cache backend configured in the environment"""
+    backend = backend or os.getenv("CACHE_BACKEND", "memory")
+    ttl = float(os.getenv("CACHE_TTL", "10"))
+    if backend == "memory":
+        return LRUCache(max_size=int(os.getenv("CACHE_MAX_SIZE", "1024")), ttl=ttl)
+    if backend == "mongo":
+        return MongoCache(ttl=ttl)
+    return NullCache()
+
+
+cache = create_cache()
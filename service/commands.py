@@ -0,0 +1,73 @@
+"""
+Module: commands
+
+Flask CLI commands for operating the service, e.g. ``flask ensure-indexes``
+"""
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from service.database import init_db
+from service.export import export_wishlists, gzip_chunks, ndjson_lines
+from service.indexes import ensure_indexes, uncovered_queries
+from service.models import Wishlist
+from service.reconciler import reconciler
+
+
+@click.command("ensure-indexes")
+@with_appcontext
+def ensure_indexes_command():
+    """Creates the indexes declared on the models"""
+    init_db(current_app.config.get("DATABASE_URI"))
+    for collection, names in ensure_indexes().items():
+        click.echo("{}: {}".format(collection, ", ".join(names) or "no indexes"))
+
+
+@click.command("index-report")
+@with_appcontext
+def index_report_command():
+    """Lists the finder queries that no index covers"""
+    init_db(current_app.config.get("DATABASE_URI"))
+    uncovered = uncovered_queries()
+    for name in uncovered:
+        click.echo("not covered: {}".format(name))
+    if not uncovered:
+        click.echo("All finder queries are covered by an index")
+
+
+@click.command("export-wishlists")
+@click.option("--output", "-o", type=click.File("wb"), default="-",
+              help="File to write to, standard output by default")
+@click.option("--gzip", "compress", is_flag=True, help="Compress the output with gzip")
+@with_appcontext
+def export_wishlists_command(output, compress):
+    """Streams every wishlist with its items as NDJSON"""
+    init_db(current_app.config.get("DATABASE_URI"))
+    lines = ndjson_lines(export_wishlists())
+    for chunk in gzip_chunks(lines) if compress else lines:
+        output.write(chunk)
+
+
+@click.command("reconcile-snapshots")
+@with_appcontext
+def reconcile_snapshots_command():
+    """Embeds missing Item snapshots and applies pending Item changes"""
+    init_db(current_app.config.get("DATABASE_URI"))
+    click.echo("Embedded snapshots in {} wishlists".format(reconciler.backfill()))
+    click.echo("Applied {} item changes".format(reconciler.run_once()))
+
+
+@click.command("prune-item-references")
+@with_appcontext
+def prune_item_references_command():
+    """Removes deleted Items from the Wishlists that still contain them"""
+    init_db(current_app.config.get("DATABASE_URI"))
+    click.echo("Removed deleted items from {} wishlists".format(Wishlist.prune_items()))
+
+
+def init_app(app):
+    """Adds the commands to the flask command of an app"""
+    for command in (ensure_indexes_command, index_report_command,
+                    export_wishlists_command, reconcile_snapshots_command,
+                    prune_item_references_command):
+        app.cli.add_command(command)
@@ -14,14 +14,17 @@
 """
 Module: error_handlers
 """
-from flask import jsonify
-from . import app, status
+from flask import current_app, jsonify
+from . import status
+
+def init_app(app):
+    """Registers the error handlers on an app"""
+    app.register_error_handler(status.HTTP_500_INTERNAL_SERVER_ERROR, internal_server_error)
 
-@app.errorhandler(status.HTTP_500_INTERNAL_SERVER_ERROR)
 def internal_server_error(error):
     """Handles unexpected server error with 500_SERVER_ERROR"""
     message = str(error)
-    app.logger.error(message)
+    current_app.logger.error(message)
     return (
         jsonify(
             status=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -0,0 +1,34 @@
+"""
+Module: export
+
+Streams every Wishlist with its Items resolved as newline delimited JSON.
+The Items are joined in by the database with $lookup and the documents are
+read from a server-side cursor, so memory use does not grow with the size
+of the collection. Lines are encoded like every other response, see
+service/representations.py.
+"""
+import zlib
+
+from service.models import Wishlist
+from service.representations import dumps
+
+
+def export_wishlists(batch_size: int = 500):
+    """Yields every Wishlist serialized with its Items, in _id order"""
+    return Wishlist.find_resolved(batch_size=batch_size)
+
+
+def ndjson_lines(documents):
+    """Encodes documents as newline delimited JSON, one line of bytes at a time"""
+    for document in documents:
+        yield dumps(document) + b"\n"
+
+
+def gzip_chunks(lines, level: int = 6):
+    """Compresses a stream of bytes into gzip chunks as it goes"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for line in lines:
+        chunk = compressor.compress(line)
+        if chunk:
+            yield chunk
+    yield compressor.flush()
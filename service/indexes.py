@@ -0,0 +1,71 @@
+"""
+Module: indexes
+
+Creates the indexes declared on each model's Meta class and reports which
+finder queries in models.py are not served by any of them.
+"""
+import logging
+
+from service.models import DELETIONS_INDEXES, Item, Wishlist, deletions
+
+logger = logging.getLogger("flask.app")
+
+MODELS = [Item, Wishlist]
+
+# The filter fields used by each finder in models.py. Finders that scan the
+# whole collection on purpose (find_all) are left out.
+FINDER_QUERIES = {
+    "Item.find": (Item, ["_id"]),
+    "Item.find_many": (Item, ["_id"]),
+    "Wishlist.find": (Wishlist, ["_id"]),
+    "Wishlist.find_many": (Wishlist, ["_id"]),
+    "Wishlist.find_by_name": (Wishlist, ["name"]),
+    "Wishlist.find_by_customer_id": (Wishlist, ["customer_id"]),
+    "Wishlist.find_resolved_by_customer_id": (Wishlist, ["customer_id"]),
+    "Wishlist.find_by_item": (Wishlist, ["items"]),
+}
+
+
+def ensure_indexes() -> dict:
+    """Creates the declared indexes of every model, and the TTL index of the deletions
+
+    This is safe to call repeatedly, Mongo leaves existing indexes alone.
+    Returns a map of collection name to the names of its declared indexes.
+    """
+    created = {}
+    for model in MODELS:
+        meta = model._mongometa
+        names = []
+        if meta.indexes:
+            names = meta.collection.create_indexes(meta.indexes)
+        logger.info("Indexes on %s: %s", meta.collection_name, names)
+        created[meta.collection_name] = names
+    collection = deletions()
+    created[collection.name] = collection.create_indexes(DELETIONS_INDEXES)
+    return created
+
+
+def _usable_keys(model) -> list:
+    """Returns the key fields of each index that can serve any query"""
+    # every collection has an _id index, even before it is first written to
+    keys = [["_id"]]
+    for info in model._mongometa.collection.index_information().values():
+        # a partial index only serves queries that repeat its filter
+        if "partialFilterExpression" in info:
+            continue
+        keys.append([field for field, _ in info["key"]])
+    return keys
+
+
+def uncovered_queries() -> list:
+    """Returns the names of the finders that no existing index can serve
+
+    A finder is covered when the leading field of some index is one of the
+    fields it filters on.
+    """
+    usable = {model: _usable_keys(model) for model in MODELS}
+    uncovered = []
+    for name, (model, fields) in FINDER_QUERIES.items():
+        if not any(keys and keys[0] in fields for keys in usable[model]):
+            uncovered.append(name)
+    return uncovered
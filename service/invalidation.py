@@ -0,0 +1,165 @@
+"""
+Module: invalidation
+
+Keeps the in-process cache of each worker (CACHE_BACKEND=memory) in step
+with the writes of every other worker and instance. A background thread in
+each worker watches the wishlist and item collections with a change stream
+and drops the cached copies of each document that changes, so entries can
+be kept for a long CACHE_TTL without going stale.
+
+Change streams need a replica set. Without one the thread polls instead,
+for Wishlists and Items whose last_modified moved on and for the documents
+recorded in the deletions collection. It is configured from the
+environment (12 factor):
+
+* CACHE_INVALIDATION: "auto" (default) watches a change stream and falls
+  back to polling, "poll" always polls, "none" relies on CACHE_TTL alone
+* CACHE_POLL_INTERVAL: seconds between polls (default 1)
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from pymongo.errors import OperationFailure
+
+from service.cache import LRUCache, cache
+from service.models import Item, Wishlist, deletions
+
+logger = logging.getLogger("flask.app")
+
+# the error code of a change stream on a server that is not a replica set
+NOT_A_REPLICA_SET = 40573
+
+
+class Invalidator:
+    """Drops the cached copies of the Wishlists and Items others write"""
+
+    def __init__(self, mode: str = "auto", poll_interval: float = 1, clock_skew: float = 2):
+        """
+        :param clock_skew: seconds that the clocks of instances may differ
+            by, polls look back that much further for changes
+        """
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.clock_skew = clock_skew
+        self.method = None
+        self.invalidated = 0
+        self._resume_token = None
+        self._since = None
+        self._pid = None
+        self._stop = threading.Event()
+
+    def invalidate(self, collection_name: str, document_id):
+        """Drops the cached copies of a document that was written"""
+        if collection_name == Wishlist._mongometa.collection_name:
+            Wishlist.invalidate(document_id)
+        elif collection_name == Item._mongometa.collection_name:
+            Item.invalidate(document_id)
+            if not Wishlist.embed_items:
+                # serialized Wishlists include their Items, the reconciler
+                # starts a new revision of them when they embed the Item
+                documents = Wishlist._mongometa.collection.find({"items": document_id}, {"_id": 1})
+                Wishlist.invalidate(*[document["_id"] for document in documents])
+        self.invalidated += 1
+
+    def watch(self):
+        """Invalidates the documents a change stream reports until stopped"""
+        names = [Wishlist._mongometa.collection_name, Item._mongometa.collection_name]
+        # inserts too, a document deleted and inserted again under the same
+        # _id may be cached as missing or as its old self
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": names},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+        }}]
+        database = Wishlist._mongometa.collection.database
+        with database.watch(
+            pipeline, resume_after=self._resume_token, max_await_time_ms=int(self.poll_interval * 1000)
+        ) as stream:
+            self.method = "change_stream"
+            while not self._stop.is_set():
+                change = stream.try_next()
+                self._resume_token = stream.resume_token
+                if change is not None:
+                    self.invalidate(change["ns"]["coll"], change["documentKey"]["_id"])
+
+    def poll_once(self) -> int:
+        """Invalidates the documents written since the last poll
+
+        Returns the number of documents invalidated.
+        """
+        started = datetime.utcnow()
+        since = (self._since or started) - timedelta(seconds=self.clock_skew)
+        changed = [
+            (model._mongometa.collection_name, document["_id"])
+            for model in (Wishlist, Item)
+            for document in model._mongometa.collection.find({"last_modified": {"$gte": since}}, {"_id": 1})
+        ]
+        changed.extend(
+            (document["collection"], document["document_id"])
+            for document in deletions().find({"last_modified": {"$gte": since}})
+        )
+        for collection_name, document_id in changed:
+            self.invalidate(collection_name, document_id)
+        self._since = started
+        return len(changed)
+
+    def poll(self):
+        """Polls for written documents until stopped"""
+        self.method = "poll"
+        while True:
+            self.poll_once()
+            if self._stop.wait(self.poll_interval):
+                return
+
+    def start(self):
+        """Starts invalidating in the background, once per process
+
+        Only the in-process cache needs it, every instance reads the same
+        entries from the other backends.
+        """
+        if self.mode == "none" or not isinstance(cache, LRUCache) or self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        self.method = None
+        self._resume_token = None
+        self._since = None
+        threading.Thread(target=self._run, name="cache-invalidator", daemon=True).start()
+
+    def stop(self):
+        """Stops the background thread"""
+        self._stop.set()
+        self._pid = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.mode == "poll" or self.method == "poll":
+                    self.poll()
+                else:
+                    self.watch()
+            except (NotImplementedError, OperationFailure) as error:
+                if isinstance(error, OperationFailure) and error.code != NOT_A_REPLICA_SET:
+                    self._recover(error)
+                    continue
+                logger.info("Change streams are not available, polling for changes instead")
+                # writes made while the stream was being opened were missed
+                cache.clear()
+                self.method = "poll"
+            except Exception as error:  # pylint: disable=broad-except
+                self._recover(error)
+
+    def _recover(self, error: Exception):
+        """Starts over after changes may have been missed"""
+        logger.error("Could not invalidate cached entries: %s", error)
+        cache.clear()
+        self._resume_token = None
+        self._since = None
+        self._stop.wait(self.poll_interval)
+
+
+invalidator = Invalidator(
+    mode=os.getenv("CACHE_INVALIDATION", "auto"),
+    poll_interval=float(os.getenv("CACHE_POLL_INTERVAL", "1")),
+)
@@ -0,0 +1,218 @@
+"""
+Module: logs
+
+Sends the logs of the service through a queue so that requests never wait
+on a stream. Handlers put records on a bounded in-memory queue, and a
+thread in each worker writes them out; records that arrive while the queue
+is full are counted and dropped rather than blocking. Long arguments, such
+as request payloads, are shortened before they are formatted, and each
+level can be sampled. It is configured from the environment (12 factor):
+
+* LOG_LEVEL: the lowest level logged (default INFO)
+* LOG_FORMAT: json for one JSON object per line, or text (default json)
+* LOG_SAMPLE_RATES: fraction of the records of a level to keep, e.g.
+  "DEBUG=0.01,INFO=0.1" (default keeps every record)
+* LOG_MAX_ARG_LENGTH: longest a log argument is rendered (default 500)
+* LOG_QUEUE_SIZE: most records waiting to be written (default 10000)
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+BRACKETS = {list: "[]", tuple: "()", set: "{}", frozenset: "{}"}
+
+
+class Shortener:
+    """Renders log arguments, stopping once they reach a length
+
+    Containers are rendered a piece at a time, so a large payload costs no
+    more than its first max_length characters.
+    """
+
+    def __init__(self, max_length: int):
+        self.max_length = max_length
+
+    def pieces(self, value):
+        """Yields the repr of a value a piece at a time"""
+        if isinstance(value, dict):
+            yield "{"
+            for index, (key, item) in enumerate(value.items()):
+                yield (", " if index else "") + repr(key) + ": "
+                yield from self.pieces(item)
+            yield "}"
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            opening, closing = BRACKETS.get(type(value), "[]")
+            yield opening
+            for index, item in enumerate(value):
+                if index:
+                    yield ", "
+                yield from self.pieces(item)
+            yield closing
+        elif isinstance(value, str):
+            yield repr(value[:self.max_length + 1])
+        else:
+            yield repr(value)
+
+    def shorten(self, value):
+        """Returns a value, or a shortened rendering of it if it could be long"""
+        if isinstance(value, (int, float, bool)) or value is None:
+            return value
+        if not isinstance(value, (dict, list, tuple, set, frozenset)):
+            text = str(value)
+            if len(text) <= self.max_length:
+                return text
+            return text[:self.max_length] + "...({} more)".format(len(text) - self.max_length)
+        rendered, length = [], 0
+        for piece in self.pieces(value):
+            rendered.append(piece)
+            length += len(piece)
+            if length > self.max_length:
+                return "".join(rendered)[:self.max_length] + "..."
+        return "".join(rendered)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a random fraction of the records of each level"""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1)
+        return rate >= 1 or random.random() < rate
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats a record as one JSON object"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class QueueWriter(QueueListener):
+    """Writes out the records of the queue on a thread"""
+
+    def enqueue_sentinel(self):
+        # wait for room rather than fail to stop when the queue is full
+        self.queue.put(self._sentinel)
+
+
+class QueueLogHandler(QueueHandler):
+    """Hands records to a writer thread through a bounded queue
+
+    The thread is started in each process that logs, since it does not
+    survive a fork.
+    """
+
+    def __init__(self, handler: logging.Handler, max_arg_length: int = 500, queue_size: int = 10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.handler = handler
+        self.shortener = Shortener(max_arg_length)
+        self.dropped = 0
+        self.listener = None
+        self._pid = None
+
+    def prepare(self, record):
+        """Renders the message with shortened arguments before it is queued
+
+        The arguments may change once the caller goes on, so they cannot be
+        rendered later by the writer thread.
+        """
+        record = copy.copy(record)
+        if isinstance(record.args, tuple):
+            record.args = tuple(self.shortener.shorten(arg) for arg in record.args)
+        elif isinstance(record.args, dict):
+            record.args = {key: self.shortener.shorten(arg) for key, arg in record.args.items()}
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        """Starts the writer thread of this process"""
+        self._pid = os.getpid()
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self.listener = QueueWriter(self.queue, self.handler, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        """Writes out every queued record and stops the writer thread"""
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+        self.listener = None
+        self._pid = None
+
+
+def parse_rates(value: str) -> dict:
+    """Parses "LEVEL=rate,..." into a map of level number to rate"""
+    rates = {}
+    for pair in filter(None, (part.strip() for part in value.split(","))):
+        name, rate = pair.split("=")
+        rates[logging.getLevelName(name.strip().upper())] = float(rate)
+    return rates
+
+
+def create_handler(stream=None) -> QueueLogHandler:
+    """Creates the queue handler configured in the environment"""
+    output = logging.StreamHandler(stream or sys.stderr)
+    if os.getenv("LOG_FORMAT", "json").lower() == "json":
+        output.setFormatter(JSONFormatter())
+    else:
+        output.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s in %(name)s: %(message)s"))
+    handler = QueueLogHandler(
+        output,
+        max_arg_length=int(os.getenv("LOG_MAX_ARG_LENGTH", "500")),
+        queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+    )
+    handler.addFilter(SamplingFilter(parse_rates(os.getenv("LOG_SAMPLE_RATES", ""))))
+    return handler
+
+
+handler = None
+
+
+def init_app(app):
+    """Sends the logs of the service through the queue handler
+
+    The handler is shared by every app created in the process.
+    """
+    global handler  # pylint: disable=global-statement
+    if handler is None:
+        handler = create_handler()
+        atexit.register(handler.stop)
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    # the modules log to flask.app, the routes to the logger of the app
+    for name in ("flask.app", app.logger.name):
+        logger = logging.getLogger(name)
+        logger.setLevel(level)
+        logger.propagate = False
+        if handler not in logger.handlers:
+            logger.handlers = [handler]
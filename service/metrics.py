@@ -0,0 +1,211 @@
+"""
+Module: metrics
+
+Measures where the time of each request goes. A pymongo CommandListener
+counts the commands a request sends to Mongo and the time they take, which
+includes the queries pymodm makes when it dereferences, and the serializers
+in models.py are timed with ``timed``. The totals are returned with each
+response in a Server-Timing header:
+
+    Server-Timing: db;dur=4.1;desc="3 commands", serialize;dur=0.8, total;dur=6.3
+
+Whatever is not db or serialize is the rest of the request: routing,
+validation, marshalling and encoding the response. Streamed responses send
+their headers first, so for them the numbers cover the time to the first
+byte. Every request is also recorded in per-route histograms, served in the
+Prometheus text format at /metrics. The histograms are kept per process,
+so each gunicorn worker reports its own.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from pymongo import monitoring
+
+# upper bounds of the histogram buckets
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+COMMAND_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestMetrics:
+    """What one request has spent so far"""
+
+    __slots__ = ("started", "db_commands", "db_time", "phases", "depth")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_commands = 0
+        self.db_time = 0.0
+        self.phases = {}
+        self.depth = {}
+
+
+def current():
+    """Returns the metrics of the request being handled, if any"""
+    if not has_request_context():
+        return None
+    return g.get("metrics")
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Adds every Mongo command to the request that sent it
+
+    pymongo publishes command events on the thread that runs the command,
+    which is the thread handling the request.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    @staticmethod
+    def _record(event):
+        metrics = current()
+        if metrics is not None:
+            metrics.db_commands += 1
+            metrics.db_time += event.duration_micros / 1e6
+
+
+@contextmanager
+def timed(phase: str):
+    """Adds the time spent in a block to a phase of the current request
+
+    Works as a decorator too. Nested blocks of the same phase are counted
+    once, and time spent in Mongo inside the block is left to db.
+    """
+    metrics = current()
+    if metrics is None or metrics.depth.get(phase):
+        yield
+        return
+    metrics.depth[phase] = 1
+    db_time = metrics.db_time
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started - (metrics.db_time - db_time)
+        metrics.phases[phase] = metrics.phases.get(phase, 0.0) + elapsed
+        metrics.depth[phase] = 0
+
+
+class Histogram:
+    """A Prometheus histogram: cumulative bucket counts, a sum and a count"""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Records one value"""
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: str):
+        """Yields the exposition lines of the histogram"""
+        for bound, count in zip(self.buckets, self.counts):
+            yield '{}_bucket{{{},le="{}"}} {}'.format(name, labels, bound, count)
+        yield '{}_bucket{{{},le="+Inf"}} {}'.format(name, labels, self.count)
+        yield "{}_sum{{{}}} {}".format(name, labels, self.sum)
+        yield "{}_count{{{}}} {}".format(name, labels, self.count)
+
+
+class Registry:
+    """The per-route histograms and counters of this process"""
+
+    METRICS = {
+        "http_request_duration_seconds": ("Time to handle a request", DURATION_BUCKETS),
+        "http_request_db_seconds": ("Time a request spent in Mongo", DURATION_BUCKETS),
+        "http_request_serialize_seconds": ("Time a request spent serializing", DURATION_BUCKETS),
+        "http_request_db_commands": ("Mongo commands sent by a request", COMMAND_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {name: {} for name in self.METRICS}
+        self._requests = {}
+
+    def observe(self, method: str, route: str, status: int, values: dict):
+        """Records one request, values maps metric names to its values"""
+        labels = 'method="{}",route="{}"'.format(method, route)
+        with self._lock:
+            for name, value in values.items():
+                histogram = self._histograms[name].get(labels)
+                if histogram is None:
+                    histogram = self._histograms[name][labels] = Histogram(self.METRICS[name][1])
+                histogram.observe(value)
+            key = '{},status="{}"'.format(labels, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text format"""
+        lines = [
+            "# HELP http_requests_total Requests handled",
+            "# TYPE http_requests_total counter",
+        ]
+        with self._lock:
+            for labels, count in sorted(self._requests.items()):
+                lines.append("http_requests_total{{{}}} {}".format(labels, count))
+            for name, (description, _) in self.METRICS.items():
+                lines.append("# HELP {} {}".format(name, description))
+                lines.append("# TYPE {} histogram".format(name))
+                for labels, histogram in sorted(self._histograms[name].items()):
+                    lines.extend(histogram.samples(name, labels))
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        """Forgets every recorded request"""
+        with self._lock:
+            self._histograms = {name: {} for name in self.METRICS}
+            self._requests = {}
+
+
+registry = Registry()
+
+# listeners must be registered before the MongoClient is created
+monitoring.register(CommandTimer())
+
+
+def start_request():
+    """Starts measuring the current request"""
+    g.metrics = RequestMetrics()
+
+
+def finish_request(response):
+    """Adds the Server-Timing header and records the request"""
+    metrics = g.pop("metrics", None)
+    if metrics is None:
+        return response
+    total = time.perf_counter() - metrics.started
+    serialize = metrics.phases.get("serialize", 0.0)
+    response.headers.add(
+        "Server-Timing",
+        'db;dur={:.2f};desc="{} commands", serialize;dur={:.2f}, total;dur={:.2f}'.format(
+            metrics.db_time * 1000, metrics.db_commands, serialize * 1000, total * 1000
+        ),
+    )
+    # unmatched URLs are grouped so that scanners cannot grow the registry
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    registry.observe(request.method, route, response.status_code, {
+        "http_request_duration_seconds": total,
+        "http_request_db_seconds": metrics.db_time,
+        "http_request_serialize_seconds": serialize,
+        "http_request_db_commands": metrics.db_commands,
+    })
+    return response
+
+
+def init_app(app):
+    """Measures every request of the app"""
+    app.before_request(start_request)
+    app.after_request(finish_request)
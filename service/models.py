@@ -1,13 +1,27 @@
 from pymodm import MongoModel, fields
+from pymodm.context_managers import no_auto_dereference
+from pymodm.errors import ValidationError
+from pymodm.manager import Manager
+from pymodm.queryset import QuerySet
 from datetime import datetime
+from functools import lru_cache
 from bson import ObjectId
 from bson.errors import InvalidId
+from pymongo import ASCENDING, TEXT, IndexModel, ReturnDocument
+from pymongo.errors import BulkWriteError
 
 import logging
+import os
+
+from service import reads
+from service.cache import cache
+from service.metrics import timed
 
 
 logger = logging.getLogger("flask.app")
 
+DATE_FORMAT = "%m/%d/%Y, %H:%M:%S"
+
 class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
@@ -15,6 +29,102 @@ class DatabaseConnectionError(Exception):
     """Custom Exception when database connection fails"""
 
 
+def paginate(queryset, limit: int = 0, after=None):
+    """Applies keyset pagination on _id to a QuerySet
+
+    :param limit: the most documents to return, 0 for no limit
+    :param after: the _id of the last document of the previous page
+    """
+    if after is not None:
+        pk = queryset._model._mongometa.pk
+        try:
+            after = pk.to_python(after)
+            pk.validate(after)
+        except ValidationError:
+            raise DataValidationError("Invalid cursor: {}".format(after))
+        queryset = queryset.raw({"_id": {"$gt": after}})
+    return queryset.order_by([("_id", 1)]).limit(limit)
+
+
+class ReadQuerySet(QuerySet):
+    """A QuerySet that reads where the current request does, see service/reads.py"""
+
+    @property
+    def _collection(self):
+        return reads.collection(self._model)
+
+    def _get_raw_cursor(self):
+        return self._collection.find(
+            self.raw_query,
+            sort=self._order_by,
+            limit=self._limit,
+            skip=self._skip,
+            projection=self._projection,
+            collation=self._collation,
+            session=reads.session(),
+        )
+
+
+ReadManager = Manager.from_queryset(ReadQuerySet)
+
+
+@lru_cache(maxsize=4096)
+def format_date(value: datetime) -> str:
+    """Formats a date the way the API returns it, remembering recent ones"""
+    return value.strftime(DATE_FORMAT)
+
+
+def _insert_batch(model, batch: list, results: list):
+    """Inserts a batch of (index, instance) pairs with one unordered insert_many
+
+    Writes that fail, e.g. on a duplicate key, replace their entry in results.
+    """
+    if not batch:
+        return
+    documents = [instance.to_son() for _, instance in batch]
+    try:
+        model._mongometa.collection.insert_many(documents, ordered=False)
+    except BulkWriteError as error:
+        for write_error in error.details["writeErrors"]:
+            index = batch[write_error["index"]][0]
+            code = 409 if write_error["code"] == 11000 else 400
+            results[index] = {"index": index, "status": code, "error": write_error["errmsg"]}
+    for (index, instance), document in zip(batch, documents):
+        if results[index]["status"] == 201:
+            instance.pk = document["_id"]
+            results[index]["id"] = instance.pk if isinstance(instance.pk, int) else str(instance.pk)
+
+
+def insert_many(model, records, batch_size: int = 1000, prepare=None) -> list:
+    """Deserializes and inserts many records, one batch at a time
+
+    Duplicate keys are reported by the database rather than checked for
+    up front. Returns one result per record, in order, with the HTTP
+    status of that record and its id or error.
+
+    :param records: an iterable of dictionaries, it is only read once
+    :param prepare: called on each valid instance before it is inserted
+    """
+    results = []
+    batch = []
+    for index, data in enumerate(records):
+        try:
+            instance = model().deserialize(data)
+            instance.full_clean()
+        except (DataValidationError, ValidationError) as error:
+            results.append({"index": index, "status": 400, "error": str(error)})
+            continue
+        if prepare:
+            prepare(instance)
+        results.append({"index": index, "status": 201})
+        batch.append((index, instance))
+        if len(batch) == batch_size:
+            _insert_batch(model, batch, results)
+            batch = []
+    _insert_batch(model, batch, results)
+    return results
+
+
 class Item(MongoModel):
     item_id = fields.IntegerField(mongo_name='_id', primary_key=True)
     item_name = fields.CharField(mongo_name='item_name')
@@ -22,8 +132,22 @@ class Item(MongoModel):
     discount = fields.IntegerField(mongo_name='discount', min_value=0, max_value=100)
     description = fields.CharField(mongo_name='description')
     date_added = fields.DateTimeField(mongo_name='date_added')
+    # set on every save, see service/invalidation.py
+    last_modified = fields.DateTimeField(required=False)
 
+    objects = ReadManager()
 
+    class Meta:
+        indexes = [
+            IndexModel([("date_added", ASCENDING)]),
+            # used to poll for changes, see service/invalidation.py
+            IndexModel([("last_modified", ASCENDING)]),
+            # used by search, see service/search.py
+            IndexModel([("item_name", TEXT), ("description", TEXT)], name="item_text",
+                       weights={"item_name": 3, "description": 1}),
+        ]
+
+    @timed("serialize")
     def serialize(self) -> dict:
         """Serializes an Item into a dictionary"""
         return {
@@ -32,7 +156,23 @@ class Item(MongoModel):
             "price": self.price,
             "discount": self.discount,
             "description": self.description,
-            "date_added": self.date_added.strftime("%m/%d/%Y, %H:%M:%S"),
+            "date_added": format_date(self.date_added),
+        }
+
+    @staticmethod
+    def serialize_document(document: dict) -> dict:
+        """Serializes a raw Item document without building an Item
+
+        This gives the same dictionary as serialize at a fraction of the cost.
+        """
+        date_added = document.get("date_added")
+        return {
+            "item_id": document["_id"],
+            "item_name": document.get("item_name"),
+            "price": document.get("price"),
+            "discount": document.get("discount"),
+            "description": document.get("description"),
+            "date_added": format_date(date_added) if date_added else None,
         }
 
     def deserialize(self, data: dict):
@@ -40,14 +180,14 @@ class Item(MongoModel):
 
         :param data: a Python dictionary representing an Item.
         """
-        logger.info("deserialize(%s)", data)
+        logger.debug("deserialize(%s)", data)
         try:
             self.item_id = data["item_id"]
             self.item_name = data["item_name"]
             self.price = data["price"]
             self.discount = data["discount"]
             self.description = data["description"]
-            self.date_added = datetime.strptime(data["date_added"],"%m/%d/%Y, %H:%M:%S")
+            self.date_added = datetime.strptime(data["date_added"], DATE_FORMAT)
             
         except KeyError as error:
             raise DataValidationError("Invalid item: missing " + error.args[0])
@@ -62,17 +202,79 @@ class Item(MongoModel):
 
         return self
     
+    @staticmethod
+    def _cache_key(item_id) -> str:
+        """Returns the key of the cached Item document"""
+        return "item:{}".format(item_id)
+
     @classmethod
-    def find(cls, item_id: int):
-        """Query that finds Items by their id"""
-        try:
-            results = cls.objects.raw({"_id": item_id})
-            if results.count():
-                return results[0]
-            else:
+    def invalidate(cls, *item_ids):
+        """Drops the cached copies of Items after they are written"""
+        cache.delete(*[cls._cache_key(item_id) for item_id in item_ids])
+
+    @classmethod
+    def find(cls, item_id: int, fields: tuple = ()):
+        """Query that finds Items by their id
+
+        :param fields: Mongo names of the only fields to load, e.g. ("_id",)
+            to check that the Item exists. Partial Items must not be saved.
+        """
+        results = cls.objects.raw({"_id": item_id})
+        if fields:
+            try:
+                return results.only(*fields).first()
+            except cls.DoesNotExist:
                 return None
-        except InvalidId:
-            return None
+        # only whole documents are cached
+        key = cls._cache_key(item_id)
+        document = cache.get(key)
+        if document is None:
+            try:
+                document = results.values().first()
+            except cls.DoesNotExist:
+                return None
+            if reads.from_primary():
+                cache.set(key, document)
+        return cls.from_document(document)
+
+    @classmethod
+    def find_many(cls, item_ids, fields: tuple = ()):
+        """Query that finds many Items by their ids in one round trip"""
+        results = cls.objects.raw({"_id": {"$in": list(item_ids)}})
+        if fields:
+            results = results.only(*fields)
+        return results
+
+    @classmethod
+    def insert_many(cls, records, batch_size: int = 1000) -> list:
+        """Creates many Items with unordered bulk inserts, see insert_many"""
+        return insert_many(cls, records, batch_size, prepare=cls._prepare_insert)
+
+    def _prepare_insert(self):
+        """Readies an Item for insert_many, which bypasses save"""
+        self.last_modified = datetime.utcnow()
+
+    def save(self, *args, **kwargs):
+        """Saves the Item, queueing its snapshots in Wishlists to be refreshed"""
+        self.last_modified = datetime.utcnow()
+        result = super().save(*args, **kwargs)
+        Item.invalidate(self.item_id)
+        if Wishlist.embed_items:
+            record_item_change(self.item_id)
+        return result
+
+    def delete(self):
+        """Deletes the Item and removes it from the Wishlists that contain it
+
+        When Wishlists embed their Items, the reconciler also removes it
+        from any Wishlist it was added to in the meantime.
+        """
+        super().delete()
+        Item.invalidate(self.item_id)
+        record_deletion(Item, self.item_id)
+        Wishlist.pull_item(self.item_id)
+        if Wishlist.embed_items:
+            record_item_change(self.item_id)
 
     @classmethod
     def find_all(cls):
@@ -80,6 +282,46 @@ class Item(MongoModel):
         results = cls.objects.all()
         return results
 
+def item_changes():
+    """The collection of Items changed since the reconciler last ran"""
+    return Item._mongometa.collection.database["item_changes"]
+
+
+def record_item_change(item_id: int):
+    """Queues the snapshots of an Item to be refreshed by the reconciler"""
+    item_changes().update_one(
+        {"_id": item_id}, {"$set": {"changed_at": datetime.utcnow()}}, upsert=True
+    )
+
+
+# deletions are only kept long enough for every poller to see them
+DELETIONS_INDEXES = [IndexModel([("last_modified", ASCENDING)], expireAfterSeconds=3600)]
+_deletions_indexed = set()
+
+
+def deletions():
+    """The collection of recently deleted documents, see service/invalidation.py
+
+    Its TTL index is created on first use in each database, as pymodm does
+    for the indexes of the models, so it never grows without bound.
+    """
+    collection = Item._mongometa.collection.database["deletions"]
+    if collection.full_name not in _deletions_indexed:
+        collection.create_indexes(DELETIONS_INDEXES)
+        _deletions_indexed.add(collection.full_name)
+    return collection
+
+
+def record_deletion(model, document_id):
+    """Records a deleted document for the instances that poll for changes"""
+    collection_name = model._mongometa.collection_name
+    deletions().update_one(
+        {"_id": "{}:{}".format(collection_name, document_id)},
+        {"$set": {"collection": collection_name, "document_id": document_id, "last_modified": datetime.utcnow()}},
+        upsert=True,
+    )
+
+
 class Wishlist(MongoModel):
 
 
@@ -90,17 +332,90 @@ class Wishlist(MongoModel):
     customer_id = fields.CharField(required=True)
     items = fields.ListField(fields.ReferenceField(model=Item), blank=True)
     isPublic = fields.BooleanField(required=False)
+    # bumped on every write, used as the ETag of the Wishlist
+    revision = fields.IntegerField(required=False)
+    last_modified = fields.DateTimeField(required=False)
+    # serialized copies of the Items, in the order of items, when embedded
+    snapshots = fields.ListField(fields.DictField(), blank=True)
+
+    # WISHLIST_STORAGE=embedded keeps a snapshot of each Item in the
+    # Wishlist so that reads need no join, see service/reconciler.py
+    embed_items = os.getenv("WISHLIST_STORAGE", "reference") == "embedded"
+
+    objects = ReadManager()
+
+    class Meta:
+        indexes = [
+            IndexModel([("customer_id", ASCENDING)]),
+            IndexModel([("name", ASCENDING)]),
+            IndexModel([("customer_id", ASCENDING), ("name", ASCENDING)]),
+            IndexModel([("isPublic", ASCENDING)], name="isPublic_true",
+                       partialFilterExpression={"isPublic": True}),
+            # multikey, finds the Wishlists that contain an Item
+            IndexModel([("items", ASCENDING)]),
+            # used to poll for changes, see service/invalidation.py
+            IndexModel([("last_modified", ASCENDING)]),
+            # used by search, see service/search.py
+            IndexModel([("name", TEXT)], name="name_text"),
+        ]
 
     ##################################################
     # INSTANCE METHODS
     ##################################################
 
-    def serialize(self) -> dict:
+    def item_ids(self) -> list:
+        """Returns the ids of the Items in the Wishlist without dereferencing them"""
+        with no_auto_dereference(Wishlist):
+            return [i.item_id if isinstance(i, Item) else i for i in self.items if i is not None]
+
+    def serialize_items(self, items: dict = None) -> list:
+        """Serializes the Items of a Wishlist into a list of dictionaries
+
+        :param items: a map of item id to Item as returned by resolve_items.
+            References that are missing from it are dropped.
+        """
+        if Wishlist.embed_items:
+            snapshots = Wishlist.embedded_items({"items": self.item_ids(), "snapshots": self.snapshots})
+            if snapshots is not None:
+                return snapshots
+        if items is None:
+            items = Wishlist.resolve_items([self])
+        return [items[i].serialize() for i in self.item_ids() if i in items]
+
+    @classmethod
+    def embedded_items(cls, document: dict):
+        """Returns the Item snapshots of a raw Wishlist document
+
+        Returns None when Items are not embedded or the document has no
+        snapshots yet, in which case its Items must be looked up.
+        """
+        if not cls.embed_items:
+            return None
+        snapshots = document.get("snapshots") or []
+        if len(snapshots) != len(document.get("items") or ()):
+            return None
+        return list(snapshots)
+
+    def refresh_snapshots(self):
+        """Copies the stored Items into the snapshots when Items are embedded"""
+        if not Wishlist.embed_items:
+            return
+        item_ids = self.item_ids()
+        items = {
+            document["_id"]: Item.serialize_document(document)
+            for document in Item.find_many(item_ids).values()
+        }
+        # references to Items that no longer exist are dropped
+        self.items = [i for i in item_ids if i in items]
+        self.snapshots = [items[i] for i in item_ids if i in items]
+
+    @timed("serialize")
+    def serialize(self, items: dict = None) -> dict:
         """Serializes a Wishlist into a dictionary"""
         data = {
             "name": self.name,
             "customer_id": self.customer_id,
-            "items": [x for x in map(lambda i: i.serialize() if i is not None else None, self.items) if x is not None],
+            "items": self.serialize_items(items),
             "isPublic": self.isPublic
         }
 
@@ -108,12 +423,52 @@ class Wishlist(MongoModel):
             data["_id"] = str(self._id) 
         return data
 
+    @property
+    def etag(self) -> str:
+        """The version token of the Wishlist, changed by every write"""
+        return str(self.revision or 0)
+
+    def new_revision(self):
+        """Moves the Wishlist to its next revision before it is written"""
+        self.revision = (self.revision or 0) + 1
+        self.last_modified = datetime.utcnow()
+
+    def save(self, *args, **kwargs):
+        """Saves the Wishlist as a new revision and drops any cached copy of it"""
+        self.new_revision()
+        self.refresh_snapshots()
+        result = super().save(*args, **kwargs)
+        Wishlist.invalidate(self._id)
+        return result
+
+    def save_if_revision(self, revision: int) -> bool:
+        """Saves the Wishlist only if the stored copy is still at a revision
+
+        The check and the write are one atomic replace, which gives
+        optimistic concurrency without reading the Wishlist again.
+        Returns False if someone else wrote the Wishlist first.
+        """
+        self.full_clean()
+        self.revision = revision
+        self.new_revision()
+        self.refresh_snapshots()
+        query = {"_id": self._id, "revision": revision or {"$in": [0, None]}}
+        result = self._mongometa.collection.replace_one(query, self.to_son())
+        Wishlist.invalidate(self._id)
+        return result.matched_count == 1
+
+    def delete(self):
+        """Deletes the Wishlist and drops any cached copy of it"""
+        super().delete()
+        Wishlist.invalidate(self._id)
+        record_deletion(Wishlist, self._id)
+
     def deserialize(self, data: dict):
         """deserializes a Wishlist my marshalling the data.
 
         :param data: a Python dictionary representing a Wishlist.
         """
-        logger.info("deserialize(%s)", data)
+        logger.debug("deserialize(%s)", data)
         try:
             self.name = data["name"]
             self.customer_id = data["customer_id"]
@@ -128,25 +483,297 @@ class Wishlist(MongoModel):
 
         # if there is no id and the data has one, assign it
         if not self._id and "_id" in data:
-            self._id = ObjectId(data["_id"])
+            try:
+                self._id = ObjectId(data["_id"])
+            except (InvalidId, TypeError):
+                raise DataValidationError("Invalid wishlist: _id {!r} is not an ObjectId".format(data["_id"]))
 
         return self
 
+    @classmethod
+    def resolve_items(cls, wishlists) -> dict:
+        """Resolves the Items referenced by many Wishlists with a single query
+
+        Returns a map of item id to Item. Items that no longer exist are
+        left out of the map so that dangling references are dropped.
+        """
+        resolved = {}
+        pending = set()
+        with no_auto_dereference(cls):
+            for wishlist in wishlists:
+                for ref in wishlist.items:
+                    if isinstance(ref, Item):
+                        resolved[ref.item_id] = ref
+                    elif ref is not None:
+                        pending.add(ref)
+        pending.difference_update(resolved)
+        if pending:
+            for item in Item.find_many(pending):
+                resolved[item.item_id] = item
+        return resolved
+
+    @classmethod
+    @timed("serialize")
+    def serialize_many(cls, wishlists) -> list:
+        """Serializes many Wishlists, resolving all of their Items at once"""
+        wishlists = list(wishlists)
+        items = cls.resolve_items(wishlists)
+        return [wishlist.serialize(items) for wishlist in wishlists]
+
+    @staticmethod
+    def serialize_document(document: dict, items: dict) -> dict:
+        """Serializes a raw Wishlist document without building a Wishlist
+
+        :param items: a map of item id to serialized Item. References that
+            are missing from it are dropped, like serialize does.
+        """
+        snapshots = Wishlist.embedded_items(document)
+        if snapshots is None:
+            snapshots = [items[i] for i in document.get("items") or () if i in items]
+        return {
+            "name": document.get("name"),
+            "customer_id": document.get("customer_id"),
+            "items": snapshots,
+            "isPublic": document.get("isPublic"),
+            "_id": str(document["_id"]),
+        }
+
+    @classmethod
+    @timed("serialize")
+    def serialize_documents(cls, documents) -> list:
+        """Serializes raw Wishlist documents, resolving all of their Items at once
+
+        Each Item is serialized once however many Wishlists contain it.
+        """
+        documents = list(documents)
+        item_ids = {
+            i for document in documents if cls.embedded_items(document) is None
+            for i in document.get("items") or ()
+        }
+        items = {}
+        if item_ids:
+            items = {
+                document["_id"]: Item.serialize_document(document)
+                for document in Item.find_many(item_ids).values()
+            }
+        return [cls.serialize_document(document, items) for document in documents]
+
+    @classmethod
+    def serialize_stream(cls, documents, batch_size: int = 100):
+        """Yields serialized raw Wishlist documents, resolving their Items one batch at a time"""
+        batch = []
+        for document in documents:
+            batch.append(document)
+            if len(batch) == batch_size:
+                yield from cls.serialize_documents(batch)
+                batch = []
+        yield from cls.serialize_documents(batch)
+
+    @classmethod
+    def insert_many(cls, records, batch_size: int = 1000) -> list:
+        """Creates many Wishlists with unordered bulk inserts, see insert_many"""
+        return insert_many(cls, records, batch_size, prepare=cls._prepare_insert)
+
+    def _prepare_insert(self):
+        """Readies a Wishlist for insert_many, which bypasses save"""
+        self.new_revision()
+        self.refresh_snapshots()
+
+    ######################################################################
+    #  A T O M I C   U P D A T E S
+    ######################################################################
+    @classmethod
+    def _find_and_update(cls, query: dict, update: dict):
+        """Applies an update to one Wishlist and returns it as it is afterwards"""
+        update.setdefault("$inc", {})["revision"] = 1
+        update.setdefault("$set", {})["last_modified"] = datetime.utcnow()
+        document = cls._mongometa.collection.find_one_and_update(
+            query, update, return_document=ReturnDocument.AFTER
+        )
+        if document is None:
+            return None
+        cls.invalidate(document["_id"])
+        return cls.from_document(document)
+
+    @classmethod
+    def add_item(cls, wishlist_id: str, item_id: int, item: Item = None):
+        """Adds an Item to a Wishlist in a single round trip
+
+        :param item: the Item, to embed a snapshot of it without finding it again
+        Returns the updated Wishlist or None if it does not exist
+        """
+        try:
+            query = {"_id": ObjectId(wishlist_id)}
+        except InvalidId:
+            return None
+        if cls.embed_items:
+            item = item or Item.find(item_id)
+            if item is not None:
+                wishlist = cls._find_and_update(
+                    dict(query, items={"$ne": item_id}),
+                    {"$push": {"items": item_id, "snapshots": item.serialize()}},
+                )
+                if wishlist is not None:
+                    return wishlist
+        return cls._find_and_update(query, {"$addToSet": {"items": item_id}})
+
+    @classmethod
+    def remove_item(cls, wishlist_id: str, item_id: int):
+        """Removes an Item from a Wishlist in a single round trip
+
+        Returns the updated Wishlist or None if the Wishlist does not
+        exist or does not contain the Item
+        """
+        try:
+            query = {"_id": ObjectId(wishlist_id), "items": item_id}
+        except InvalidId:
+            return None
+        return cls._find_and_update(
+            query, {"$pull": {"items": item_id, "snapshots": {"item_id": item_id}}}
+        )
+
+    @classmethod
+    def make_public(cls, wishlist_id: str):
+        """Makes a Wishlist public in a single round trip
+
+        Returns the updated Wishlist or None if it does not exist
+        """
+        try:
+            query = {"_id": ObjectId(wishlist_id)}
+        except InvalidId:
+            return None
+        return cls._find_and_update(query, {"$set": {"isPublic": True}})
+
+    @classmethod
+    def empty(cls, wishlist_id: str):
+        """Removes every Item from a Wishlist in a single round trip
+
+        Returns the updated Wishlist or None if it does not exist
+        """
+        try:
+            query = {"_id": ObjectId(wishlist_id)}
+        except InvalidId:
+            return None
+        return cls._find_and_update(query, {"$set": {"items": [], "snapshots": []}})
+
+    ######################################################################
+    #  C A C H I N G
+    ######################################################################
+    @staticmethod
+    def _cache_keys(wishlist_id) -> tuple:
+        """Returns the keys of the cached document and serialized Wishlist"""
+        return ("wishlist:{}".format(wishlist_id), "wishlist:{}:serialized".format(wishlist_id))
+
+    @classmethod
+    def invalidate(cls, *wishlist_ids):
+        """Drops the cached copies of Wishlists after they are written"""
+        keys = []
+        for wishlist_id in wishlist_ids:
+            keys.extend(cls._cache_keys(wishlist_id))
+        cache.delete(*keys)
+
+    @classmethod
+    def pull_item(cls, item_id: int) -> int:
+        """Removes a deleted Item from every Wishlist that contains it
+
+        A single update_many, served by the index on items, pulls the
+        reference and any snapshot and starts a new revision of each
+        Wishlist, so reads no longer come across the dangling reference.
+        Returns the number of Wishlists changed.
+        """
+        # only needed to drop the cached copies, on the same index
+        documents = cls._mongometa.collection.find({"items": item_id}, {"_id": 1})
+        wishlist_ids = [document["_id"] for document in documents]
+        if not wishlist_ids:
+            return 0
+        result = cls._mongometa.collection.update_many(
+            {"items": item_id},
+            {
+                "$pull": {"items": item_id, "snapshots": {"item_id": item_id}},
+                "$inc": {"revision": 1},
+                "$set": {"last_modified": datetime.utcnow()},
+            },
+        )
+        cls.invalidate(*wishlist_ids)
+        return result.modified_count
+
+    @classmethod
+    def prune_items(cls) -> int:
+        """Removes the references to Items that no longer exist from every Wishlist
+
+        Wishlists stored before Item deletes cascaded may still hold them.
+        Returns the number of Wishlists changed.
+        """
+        referenced = cls._mongometa.collection.distinct("items")
+        existing = {document["_id"] for document in Item.find_many(referenced, fields=("_id",)).values()}
+        missing = [item_id for item_id in referenced if item_id not in existing]
+        return sum(cls.pull_item(item_id) for item_id in missing)
+
+    @timed("serialize")
+    def serialize_cached(self) -> dict:
+        """Serializes a Wishlist fetched with find, from the cache when possible
+
+        Only use this on Wishlists that have not been changed since they
+        were fetched.
+        """
+        key = Wishlist._cache_keys(self._id)[1]
+        data = cache.get(key)
+        if data is None:
+            data = self.serialize()
+            if reads.from_primary():
+                cache.set(key, data)
+        return data
+
     ######################################################################
     #  F I N D E R   M E T H O D S
     ######################################################################
     @classmethod
-    def find(cls, wishlist_id: str):
-        """Query that finds Wishlists by their id"""
+    def find(cls, wishlist_id: str, fields: tuple = (), cached: bool = True):
+        """Query that finds Wishlists by their id
+
+        :param fields: Mongo names of the only fields to load, e.g. ("_id",)
+            to check that the Wishlist exists. Partial Wishlists must not be saved.
+        :param cached: False to read the stored copy past the cache, which
+            writes must do since a cached copy may be stale
+        """
         try:
-            results = cls.objects.raw({"_id": ObjectId(wishlist_id)})
-            if results.count():
-                return results[0]
-            else:
-                return None
+            wishlist_id = ObjectId(wishlist_id)
         except InvalidId:
             return None
+        results = cls.objects.raw({"_id": wishlist_id})
+        if fields:
+            try:
+                return results.only(*fields).first()
+            except cls.DoesNotExist:
+                return None
+        # only whole documents are cached
+        key = cls._cache_keys(wishlist_id)[0]
+        document = cache.get(key) if cached else None
+        if document is None:
+            try:
+                document = results.values().first()
+            except cls.DoesNotExist:
+                return None
+            if reads.from_primary():
+                cache.set(key, document)
+        return cls.from_document(document)
+
+    @classmethod
+    def find_many(cls, wishlist_ids, fields: tuple = ()):
+        """Query that finds many Wishlists by their ids in one round trip
 
+        Ids that are not valid ObjectIds are skipped
+        """
+        ids = []
+        for wishlist_id in wishlist_ids:
+            try:
+                ids.append(ObjectId(wishlist_id))
+            except (InvalidId, TypeError):
+                continue
+        results = cls.objects.raw({"_id": {"$in": ids}})
+        if fields:
+            results = results.only(*fields)
+        return results
 
     @classmethod
     def find_all(cls):
@@ -166,4 +793,59 @@ class Wishlist(MongoModel):
         results = cls.objects.raw({"customer_id": customer_id})
         return results
 
+    @classmethod
+    def find_by_item(cls, item_id: int):
+        """Query that finds the Wishlists that contain an Item"""
+        return cls.objects.raw({"items": item_id})
+
+    @classmethod
+    def resolved_pipeline(cls, match: dict = None) -> list:
+        """Aggregation that joins in the Items of the Wishlists matching a filter"""
+        pipeline = [{"$match": match}] if match else []
+        return pipeline + [
+            {"$sort": {"_id": 1}},
+            {"$lookup": {
+                "from": Item._mongometa.collection_name,
+                "localField": "items",
+                "foreignField": "_id",
+                "as": "resolved_items",
+            }},
+            # only what serialize_document reads
+            {"$project": {
+                "revision": 0, "last_modified": 0, "_cls": 0, "snapshots": 0, "resolved_items._cls": 0,
+            }},
+        ]
+
+    @classmethod
+    def find_resolved(cls, match: dict = None, batch_size: int = 500):
+        """Yields the Wishlists matching a filter serialized with their Items, in _id order
+
+        The Items are joined in by the database, or read from the snapshots
+        when they are embedded, so each batch of Wishlists costs a single
+        round trip.
+        """
+        collection = reads.collection(cls)
+        if cls.embed_items:
+            cursor = collection.find(
+                match or {}, {"revision": 0, "last_modified": 0, "_cls": 0}, batch_size=batch_size,
+                session=reads.session(),
+            ).sort("_id", ASCENDING)
+            yield from cls.serialize_stream(cursor, batch_size)
+            return
+        cursor = collection.aggregate(
+            cls.resolved_pipeline(match), allowDiskUse=True, batchSize=batch_size, session=reads.session()
+        )
+        for document in cursor:
+            items = {
+                item["_id"]: Item.serialize_document(item)
+                for item in document.pop("resolved_items")
+            }
+            yield cls.serialize_document(document, items)
+
+    @classmethod
+    @timed("serialize")
+    def find_resolved_by_customer_id(cls, customer_id: str) -> list:
+        """Finds the Wishlists of a customer serialized with their Items"""
+        return list(cls.find_resolved({"customer_id": customer_id}))
+
     #Add any more find methods as needed:
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+Module: querylog
+
+Logs the reads that the finders in models.py send to Mongo when they are
+slow, and captures their query plans. It is configured from the
+environment (12 factor):
+
+* SLOW_QUERY_MS: reads that take at least this long are logged with their
+  filter and duration (default 100, 0 to log every read)
+* QUERY_EXPLAIN_SLOW: explain slow reads too, to log how many documents
+  they examined and whether they scanned the collection (default true)
+* QUERY_EXPLAIN_SAMPLE_RATE: fraction of all other reads to explain, to
+  catch collection scans before they are slow (default 0, off)
+
+Explains run on a background thread so that requests never wait for them,
+and are dropped when too many are queued.
+"""
+import logging
+import os
+import queue
+import random
+import threading
+
+from pymodm.connection import _get_db
+from pymongo import monitoring
+
+logger = logging.getLogger("flask.app")
+
+# the commands that read, and the field holding what they filter on
+READ_COMMANDS = {"find": "filter", "count": "query", "distinct": "query", "aggregate": "pipeline"}
+# fields the driver adds that explain does not accept
+DRIVER_FIELDS = ("lsid", "$db", "$clusterTime", "$readPreference", "txnNumber")
+
+
+def explain(database: str, command: dict) -> dict:
+    """Runs explain on a read command and returns its execution stats"""
+    command = {key: value for key, value in command.items() if key not in DRIVER_FIELDS}
+    return _get_db().client[database].command("explain", command, verbosity="executionStats")
+
+
+def _values(document, key: str):
+    """Yields every value stored under key anywhere in a nested document"""
+    if isinstance(document, dict):
+        for name, value in document.items():
+            if name == key:
+                yield value
+            yield from _values(value, key)
+    elif isinstance(document, list):
+        for value in document:
+            yield from _values(value, key)
+
+
+def summarize_plan(plan: dict) -> dict:
+    """Returns the documents examined and the winning stages of an explain"""
+    stages = [
+        stage for winning in _values(plan, "winningPlan") for stage in _values(winning, "stage")
+    ]
+    return {
+        "docs_examined": sum(_values(plan, "totalDocsExamined")),
+        "keys_examined": sum(_values(plan, "totalKeysExamined")),
+        "collscan": "COLLSCAN" in stages,
+        "stages": stages,
+    }
+
+
+class QueryLog(monitoring.CommandListener):
+    """Watches the reads sent to Mongo for slow queries and collection scans"""
+
+    def __init__(self, slow_ms: float = 100, explain_slow: bool = True, sample_rate: float = 0,
+                 explainer=explain, max_pending: int = 100):
+        self.slow_ms = slow_ms
+        self.explain_slow = explain_slow
+        self.sample_rate = sample_rate
+        self.explainer = explainer
+        self.slow_queries = 0
+        self.collscans = 0
+        self._started = {}
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._worker_pid = None
+
+    def started(self, event):
+        if event.command_name in READ_COMMANDS:
+            self._started[(event.connection_id, event.request_id)] = (event.database_name, event.command)
+
+    def succeeded(self, event):
+        read = self._started.pop((event.connection_id, event.request_id), None)
+        if read is None:
+            return
+        database, command = read
+        duration_ms = event.duration_micros / 1000
+        slow = duration_ms >= self.slow_ms
+        if slow:
+            self.slow_queries += 1
+        if slow and not self.explain_slow:
+            self.log(database, command, duration_ms, slow)
+        elif slow or (self.sample_rate and random.random() < self.sample_rate):
+            self._submit((database, command, duration_ms, slow))
+
+    def failed(self, event):
+        self._started.pop((event.connection_id, event.request_id), None)
+
+    def log(self, database: str, command: dict, duration_ms: float, slow: bool, plan: dict = None):
+        """Logs a read, with what its plan examined if it was explained"""
+        name = next(iter(command))
+        filter_ = command.get(READ_COMMANDS[name])
+        message = "%s on %s.%s filter=%s took %.1f ms"
+        args = [name, database, command[name], filter_, duration_ms]
+        if plan is not None:
+            message += ", examined %d documents and %d keys with %s"
+            args += [plan["docs_examined"], plan["keys_examined"], " > ".join(reversed(plan["stages"]))]
+        if plan is not None and plan["collscan"]:
+            logger.warning("Collection scan: " + message, *args)
+        elif slow:
+            logger.warning("Slow query: " + message, *args)
+        else:
+            logger.info("Sampled query: " + message, *args)
+
+    def explain(self, database: str, command: dict, duration_ms: float, slow: bool):
+        """Explains a read and logs it if it was slow or scanned the collection"""
+        try:
+            plan = summarize_plan(self.explainer(database, command))
+        except Exception as error:  # pylint: disable=broad-except
+            logger.debug("Could not explain %s: %s", command, error)
+            if slow:
+                self.log(database, command, duration_ms, slow)
+            return
+        if plan["collscan"]:
+            self.collscans += 1
+        if slow or plan["collscan"]:
+            self.log(database, command, duration_ms, slow, plan)
+
+    def _submit(self, read: tuple):
+        """Queues a read to be explained, starting the worker in this process"""
+        if self._worker_pid != os.getpid():
+            # the worker thread of a parent process does not survive a fork
+            self._worker_pid = os.getpid()
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            threading.Thread(target=self._work, name="query-explain", daemon=True).start()
+        try:
+            self._queue.put_nowait(read)
+        except queue.Full:
+            logger.debug("Too many queries waiting to be explained, dropped one")
+
+    def _work(self):
+        while True:
+            self.explain(*self._queue.get())
+            self._queue.task_done()
+
+    def drain(self):
+        """Waits until every queued read has been explained"""
+        self._queue.join()
+
+
+def create_query_log() -> QueryLog:
+    """Creates the query log configured in the environment"""
+    return QueryLog(
+        slow_ms=float(os.getenv("SLOW_QUERY_MS", "100")),
+        explain_slow=os.getenv("QUERY_EXPLAIN_SLOW", "true").lower() in ("1", "true", "yes"),
+        sample_rate=float(os.getenv("QUERY_EXPLAIN_SAMPLE_RATE", "0")),
+    )
+
+
+query_log = create_query_log()
+
+# listeners must be registered before the MongoClient is created
+monitoring.register(query_log)
@@ -0,0 +1,222 @@
+"""
+Module: reads
+
+Chooses where the reads of each request are sent. Writes, and the reads of
+the requests that write, always go to the primary. The GET routes can read
+from secondaries instead, configured from the environment (12 factor):
+
+* READ_PREFERENCE: primary (default), primaryPreferred, secondary,
+  secondaryPreferred or nearest
+* READ_MAX_STALENESS: seconds a secondary may lag behind the primary and
+  still be read from, at least 90 (default no limit)
+* READ_PREFERENCES: overrides per route, e.g.
+  "/wishlists=secondaryPreferred:120,/wishlists/<wishlist_id>=primary"
+
+A secondary may not have the writes a client just made yet. Every response
+to a write carries an X-Causal-Token header with the time of its last write.
+A client that sends the token back with its next reads gets them in a
+causally consistent session, so the secondary waits until it has caught up
+with that write before it answers. CAUSAL_CONSISTENCY=false turns this off.
+Tokens are sent by clients, so ones that are not well formed are ignored,
+and ones the server rejects, e.g. with a forged signature, get a 400.
+"""
+import base64
+import binascii
+import logging
+import os
+from collections.abc import Mapping
+
+from bson import BSON, Timestamp
+from bson.errors import InvalidBSON
+from flask import g, has_request_context, request
+from pymongo import monitoring
+from pymongo.read_preferences import ReadPreference, make_read_preference, read_pref_mode_from_name
+
+TOKEN_HEADER = "X-Causal-Token"
+WRITE_COMMANDS = ("insert", "update", "delete", "findAndModify")
+# the errors of reads after a token the server does not accept: an
+# operation time ahead of the cluster (InvalidOptions) or a cluster time
+# whose signature does not check out (TimeProofMismatch, KeyNotFound)
+REJECTED_TOKEN_CODES = (72, 204, 211)
+
+logger = logging.getLogger("flask.app")
+
+
+def parse_preference(value: str, max_staleness: int = -1):
+    """Parses "mode" or "mode:max_staleness" into a read preference"""
+    mode, _, staleness = value.strip().partition(":")
+    mode = read_pref_mode_from_name(mode.strip())
+    if mode == ReadPreference.PRIMARY.mode:
+        return ReadPreference.PRIMARY
+    return make_read_preference(mode, None, int(staleness) if staleness else max_staleness)
+
+
+def parse_preferences(value: str, max_staleness: int = -1) -> dict:
+    """Parses "rule=mode[:max_staleness],..." into a map of rule to read preference"""
+    preferences = {}
+    for pair in filter(None, (part.strip() for part in value.split(","))):
+        rule, _, preference = pair.rpartition("=")
+        preferences[rule.strip()] = parse_preference(preference, max_staleness)
+    return preferences
+
+
+class ReadSettings:
+    """The read preference of each GET route"""
+
+    def __init__(self, default=ReadPreference.PRIMARY, routes: dict = None, causal: bool = True):
+        self.default = default
+        self.routes = routes or {}
+        self.causal = causal
+
+    def preference(self, method: str, rule: str = None):
+        """Returns the read preference of a route"""
+        if method not in ("GET", "HEAD"):
+            return ReadPreference.PRIMARY
+        return self.routes.get(rule, self.default)
+
+    @classmethod
+    def from_environment(cls):
+        """Reads the settings configured in the environment"""
+        max_staleness = int(os.getenv("READ_MAX_STALENESS", "-1"))
+        return cls(
+            default=parse_preference(os.getenv("READ_PREFERENCE", "primary"), max_staleness),
+            routes=parse_preferences(os.getenv("READ_PREFERENCES", ""), max_staleness),
+            causal=os.getenv("CAUSAL_CONSISTENCY", "true").lower() in ("true", "1", "yes"),
+        )
+
+
+settings = ReadSettings.from_environment()
+
+
+######################################################################
+# Causal tokens
+######################################################################
+def encode_token(operation_time, cluster_time) -> str:
+    """Encodes the time of a write, and the signed cluster time that vouches for it"""
+    document = BSON.encode({"operationTime": operation_time, "clusterTime": cluster_time})
+    return base64.urlsafe_b64encode(document).decode("ascii")
+
+
+def decode_token(token: str):
+    """Returns the operation and cluster times of a token, or None if it is not valid"""
+    try:
+        document = BSON(base64.urlsafe_b64decode(token.encode("ascii"))).decode()
+        operation_time, cluster_time = document["operationTime"], document["clusterTime"]
+    except (binascii.Error, InvalidBSON, KeyError, TypeError, UnicodeEncodeError, ValueError):
+        return None
+    if not isinstance(operation_time, Timestamp) or not isinstance(cluster_time, Mapping) \
+            or not isinstance(cluster_time.get("clusterTime"), Timestamp):
+        return None
+    return operation_time, cluster_time
+
+
+class WriteTimes(monitoring.CommandListener):
+    """Remembers the time of the last write of each request
+
+    pymongo publishes command events on the thread that runs the command,
+    which is the thread handling the request. Only replica sets return the
+    times, so there is no token on a standalone server.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if event.command_name not in WRITE_COMMANDS or not has_request_context():
+            return
+        operation_time = event.reply.get("operationTime")
+        cluster_time = event.reply.get("$clusterTime")
+        if operation_time is None or cluster_time is None:
+            return
+        last = g.get("last_write")
+        if last is None or operation_time > last[0]:
+            g.last_write = (operation_time, cluster_time)
+
+    def failed(self, event):
+        pass
+
+
+# listeners must be registered before the MongoClient is created
+monitoring.register(WriteTimes())
+
+
+######################################################################
+# The reads of the current request
+######################################################################
+def read_preference():
+    """Returns the read preference of the current request, primary outside of one"""
+    if not has_request_context():
+        return ReadPreference.PRIMARY
+    return g.get("read_preference", ReadPreference.PRIMARY)
+
+
+def from_primary() -> bool:
+    """Tells whether the current request reads from the primary
+
+    Only what it reads there may be cached, a secondary may be behind.
+    """
+    return read_preference() is ReadPreference.PRIMARY
+
+
+def collection(model):
+    """Returns the collection of a model with the read preference of the current request"""
+    collection = model._mongometa.collection
+    if from_primary():
+        return collection
+    return collection.with_options(read_preference=read_preference())
+
+
+def session():
+    """Returns the causally consistent session of the current request, if any"""
+    if not has_request_context():
+        return None
+    return g.get("read_session")
+
+
+def start_request():
+    """Chooses where the request reads, in a session after the client's writes"""
+    preference = settings.preference(request.method, request.url_rule.rule if request.url_rule else None)
+    if preference is ReadPreference.PRIMARY:
+        return
+    g.read_preference = preference
+    times = decode_token(request.headers.get(TOKEN_HEADER, "")) if settings.causal else None
+    if times is not None:
+        # imported here since the client is only created on the first request
+        from service.database import get_client  # pylint: disable=import-outside-toplevel
+        read_session = get_client().start_session(causal_consistency=True)
+        try:
+            read_session.advance_cluster_time(times[1])
+            read_session.advance_operation_time(times[0])
+        except (TypeError, ValueError) as error:
+            # the reads go ahead without the client's writes
+            logger.warning("Ignoring a causal token that is not valid: %s", error)
+            read_session.end_session()
+            return
+        g.read_session = read_session
+
+
+def token_rejected(error) -> bool:
+    """Tells whether a read failed because the server rejected the client's token"""
+    return session() is not None and getattr(error, "code", None) in REJECTED_TOKEN_CODES
+
+
+def finish_request(response):
+    """Returns the time of the request's last write to the client"""
+    last = g.pop("last_write", None)
+    if last is not None and settings.causal:
+        response.headers[TOKEN_HEADER] = encode_token(*last)
+    return response
+
+
+def end_request(error=None):  # pylint: disable=unused-argument
+    """Ends the session of the request"""
+    read_session = g.pop("read_session", None)
+    if read_session is not None:
+        read_session.end_session()
+
+
+def init_app(app):
+    """Routes the reads of every request of the app"""
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.teardown_request(end_request)
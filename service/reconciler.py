@@ -0,0 +1,117 @@
+"""
+Module: reconciler
+
+Keeps the Item snapshots embedded in Wishlists (WISHLIST_STORAGE=embedded)
+consistent with the Item collection. Item.save and Item.delete record the
+id of the Item in the item_changes collection, and a background thread in
+each worker copies the Item into, or removes it from, every Wishlist that
+contains it. Recording the change in Mongo rather than in memory means any
+worker can apply it, and none is lost when a worker restarts.
+
+SNAPSHOT_MAX_STALENESS (seconds, default 5) bounds how long a snapshot may
+lag behind its Item: the reconciler polls twice within it.
+"""
+import logging
+import os
+import threading
+from datetime import datetime
+
+from pymongo import ASCENDING
+
+from service.models import Item, Wishlist, item_changes
+
+logger = logging.getLogger("flask.app")
+
+
+class Reconciler:
+    """Applies recorded Item changes to the Wishlists that embed the Items"""
+
+    def __init__(self, max_staleness: float = 5, batch_size: int = 100):
+        self.max_staleness = max_staleness
+        self.batch_size = batch_size
+        self.applied = 0
+        self._pid = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def apply(item_id: int) -> int:
+        """Copies an Item into the Wishlists that contain it, or removes it
+        from them if it was deleted. Returns the number of Wishlists changed.
+        """
+        documents = Wishlist._mongometa.collection.find({"items": item_id}, {"_id": 1})
+        wishlist_ids = [document["_id"] for document in documents]
+        if not wishlist_ids:
+            return 0
+        # read past the cache, which may not have seen the change yet
+        item = next(iter(Item.find_many([item_id])), None)
+        query = {"_id": {"$in": wishlist_ids}}
+        update = {"$inc": {"revision": 1}, "$set": {"last_modified": datetime.utcnow()}}
+        if item is None:
+            update["$pull"] = {"items": item_id, "snapshots": {"item_id": item_id}}
+        else:
+            # the positional operator updates the snapshot the query matched
+            query["snapshots.item_id"] = item_id
+            update["$set"]["snapshots.$"] = item.serialize()
+        result = Wishlist._mongometa.collection.update_many(query, update)
+        Wishlist.invalidate(*wishlist_ids)
+        return result.modified_count
+
+    def run_once(self) -> int:
+        """Applies every recorded change, returns how many were applied"""
+        applied = 0
+        while True:
+            changes = list(item_changes().find().sort("changed_at", ASCENDING).limit(self.batch_size))
+            for change in changes:
+                self.apply(change["_id"])
+                # a change recorded again meanwhile stays for the next round
+                item_changes().delete_one({"_id": change["_id"], "changed_at": change["changed_at"]})
+            applied += len(changes)
+            if len(changes) < self.batch_size:
+                break
+        self.applied += applied
+        return applied
+
+    @staticmethod
+    def backfill() -> int:
+        """Embeds snapshots in the Wishlists stored before Items were embedded
+
+        Returns the number of Wishlists updated.
+        """
+        if not Wishlist.embed_items:
+            return 0
+        updated = 0
+        for document in Wishlist._mongometa.collection.find({}, {"items": 1, "snapshots": 1}):
+            if Wishlist.embedded_items(document) is not None:
+                continue
+            wishlist = Wishlist.from_document(document)
+            wishlist.refresh_snapshots()
+            Wishlist._mongometa.collection.update_one(
+                {"_id": document["_id"]},
+                {"$set": {"items": wishlist.item_ids(), "snapshots": wishlist.snapshots}},
+            )
+            Wishlist.invalidate(document["_id"])
+            updated += 1
+        return updated
+
+    def start(self):
+        """Starts reconciling in the background, once per process"""
+        if not Wishlist.embed_items or self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        threading.Thread(target=self._run, name="snapshot-reconciler", daemon=True).start()
+
+    def stop(self):
+        """Stops the background thread after its current round"""
+        self._stop.set()
+        self._pid = None
+
+    def _run(self):
+        while not self._stop.wait(self.max_staleness / 2):
+            try:
+                self.run_once()
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error("Could not reconcile Item snapshots: %s", error)
+
+
+reconciler = Reconciler(max_staleness=float(os.getenv("SNAPSHOT_MAX_STALENESS", "5")))
@@ -0,0 +1,132 @@
+"""
+Module: representations
+
+The JSON representation of the REST API, registered on the api in
+routes.py in place of the flask-restx default.
+
+Bodies are encoded with orjson when it is installed, which is several
+times faster than the json module and encodes datetimes itself. ObjectIds
+are encoded as strings. Lists of at least JSON_STREAM_MIN_ITEMS (default
+1000) elements are streamed a chunk at a time instead of being encoded
+whole. Bodies of at least COMPRESS_MIN_BYTES (default 1024) are compressed
+with the first encoding of RESPONSE_COMPRESSION (default "br,gzip", empty
+to disable) that the client accepts; br needs the brotli package.
+"""
+import json
+import os
+import zlib
+from datetime import date
+
+from bson import ObjectId
+from flask import Response, current_app, request
+
+from service import status
+from service.metrics import timed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STREAM_MIN_ITEMS = int(os.getenv("JSON_STREAM_MIN_ITEMS", "1000"))
+STREAM_CHUNK_ITEMS = 100
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESSION = [
+    encoding.strip() for encoding in os.getenv("RESPONSE_COMPRESSION", "br,gzip").split(",")
+    if encoding.strip() and (encoding.strip() != "br" or brotli is not None)
+]
+
+
+def default(value):
+    """Encodes the values that JSON has no type for"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError("Object of type {} is not JSON serializable".format(type(value).__name__))
+
+
+def dumps(data, indent: bool = False) -> bytes:
+    """Encodes data as JSON"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, default=default, option=option)
+    return json.dumps(data, default=default, indent=4 if indent else None).encode("utf-8")
+
+
+def loads(data):
+    """Decodes JSON, raising ValueError if it is not valid"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def list_chunks(data: list, chunk_size: int = STREAM_CHUNK_ITEMS):
+    """Encodes a list as JSON a chunk of elements at a time"""
+    yield b"["
+    for start in range(0, len(data), chunk_size):
+        if start:
+            yield b","
+        yield dumps(data[start:start + chunk_size])[1:-1]
+    yield b"]\n"
+
+
+def accepted_encoding():
+    """Returns the preferred compression the client accepts, if any"""
+    for encoding in COMPRESSION:
+        if request.accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+class Compressor:
+    """Compresses a stream with gzip or brotli"""
+
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=4)
+            self.compress, self.flush = self._compressor.process, self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            self.compress, self.flush = self._compressor.compress, self._compressor.flush
+
+
+def compress_chunks(chunks, encoding: str):
+    """Compresses a stream of chunks as it goes"""
+    compressor = Compressor(encoding)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def output_json(data, code, headers=None):
+    """Makes a Flask response with a JSON encoded body"""
+    if code == status.HTTP_304_NOT_MODIFIED:
+        response = Response(b"", code)
+        response.headers.extend(headers or {})
+        return response
+    encoding = accepted_encoding()
+    if isinstance(data, list) and len(data) >= STREAM_MIN_ITEMS:
+        chunks = list_chunks(data)
+        response = Response(compress_chunks(chunks, encoding) if encoding else chunks, code)
+    else:
+        with timed("serialize"):
+            body = dumps(data, indent=current_app.debug) + b"\n"
+        if encoding and len(body) >= COMPRESS_MIN_BYTES:
+            body = b"".join(compress_chunks([body], encoding))
+        else:
+            encoding = None
+        response = Response(body, code)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if COMPRESSION:
+        response.vary.add("Accept-Encoding")
+    response.headers.extend(headers or {})
+    return response
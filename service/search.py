@@ -0,0 +1,194 @@
+"""
+Module: search
+
+Ranked search of Wishlists by their name and by the names and
+descriptions of the Items they contain.
+
+Mongo scores the matches with the text indexes declared on the models. A
+Wishlist scores for its own name plus the score of every matching Item in
+it, so a Wishlist named "books" full of novels ranks above one that only
+holds a single novel. The matching Wishlists are then read and their Items
+resolved in one batch.
+
+Servers without $text support, such as the in-memory stand-ins used in
+development, and collections whose text index was not created yet, are
+searched with an in-process index built from the same
+fields and weights. It matches word prefixes through a trigram index
+rather than stemming words like Mongo does, so "book" still finds "books".
+The index of each collection is kept between searches and only built again
+once the collection changes, which one query on the last_modified index
+and a document count tell.
+"""
+import logging
+import os
+import re
+import threading
+from collections import defaultdict
+
+from pymongo.errors import OperationFailure
+
+from service.models import Item, Wishlist
+
+logger = logging.getLogger("flask.app")
+
+# the most Wishlists, and Items, ranked for one search
+MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "1000"))
+
+# the error code of $text on a collection without a text index
+INDEX_NOT_FOUND = 27
+
+WORD = re.compile(r"\w+")
+
+
+def words(text) -> list:
+    """Splits text into lowercase words"""
+    return WORD.findall(str(text).lower()) if text else []
+
+
+def trigrams(word: str) -> set:
+    """Returns the three letter substrings of a word"""
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def text_weights(model) -> dict:
+    """Returns the weight of each field in the text index of a model"""
+    for index in model._mongometa.indexes or ():
+        keys = index.document["key"]
+        fields = [field for field, kind in keys.items() if kind == "text"]
+        if fields:
+            weights = index.document.get("weights", {})
+            return {field: weights.get(field, 1) for field in fields}
+    raise ValueError("{} has no text index".format(model.__name__))
+
+
+class TextIndex:
+    """An in-process inverted index that matches words and their prefixes"""
+
+    def __init__(self, weights: dict):
+        self.weights = weights
+        # word -> {document id: weighted number of occurrences}
+        self.postings = defaultdict(lambda: defaultdict(float))
+        # trigram -> words that contain it
+        self.trigrams = defaultdict(set)
+
+    def add(self, document: dict):
+        """Indexes the text fields of a document"""
+        for field, weight in self.weights.items():
+            for word in words(document.get(field)):
+                if word not in self.postings:
+                    for trigram in trigrams(word):
+                        self.trigrams[trigram].add(word)
+                self.postings[word][document["_id"]] += weight
+
+    def expand(self, prefix: str) -> list:
+        """Returns the indexed words that start with a prefix"""
+        if len(prefix) < 3:
+            candidates = self.postings.keys()
+        else:
+            candidates = set.intersection(*(self.trigrams.get(t, set()) for t in trigrams(prefix)))
+        return [word for word in candidates if word.startswith(prefix)]
+
+    def search(self, query: str) -> dict:
+        """Returns the score of every document that matches a word of the query
+
+        A word found as a prefix of a longer one counts for the share of it
+        that it covers, so exact matches rank first.
+        """
+        scores = defaultdict(float)
+        for prefix in set(words(query)):
+            for word in self.expand(prefix):
+                for document_id, weight in self.postings[word].items():
+                    scores[document_id] += weight * len(prefix) / len(word)
+        return dict(scores)
+
+
+# collection name -> (version of the collection, its TextIndex)
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def collection_version(collection) -> tuple:
+    """Returns what changes whenever a document is written to or deleted from a collection"""
+    latest = list(collection.find({}, {"last_modified": 1}).sort("last_modified", -1).limit(1))
+    return collection.estimated_document_count(), latest[0].get("last_modified") if latest else None
+
+
+def text_index(model) -> TextIndex:
+    """Returns the in-process index of a model, built again only if its collection changed"""
+    collection = model._mongometa.collection
+    # one search builds the index while the others wait for it
+    with _indexes_lock:
+        version = collection_version(collection)
+        cached = _indexes.get(collection.full_name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        weights = text_weights(model)
+        index = TextIndex(weights)
+        for document in collection.find({}, dict.fromkeys(weights, 1)):
+            index.add(document)
+        _indexes[collection.full_name] = (version, index)
+        return index
+
+
+def text_scores(model, query: str, match: dict = None) -> dict:
+    """Returns the text score of the best matching documents of a model by _id"""
+    collection = model._mongometa.collection
+    match = match or {}
+    try:
+        cursor = collection.aggregate([
+            {"$match": dict(match, **{"$text": {"$search": query}})},
+            {"$sort": {"score": {"$meta": "textScore"}}},
+            {"$limit": MAX_CANDIDATES},
+            {"$project": {"score": {"$meta": "textScore"}}},
+        ])
+        return {document["_id"]: document["score"] for document in cursor}
+    except NotImplementedError as error:
+        logger.debug("No $text search on %s, searching in process: %s", collection.name, error)
+    except OperationFailure as error:
+        # any other failure is the database's, and is not hidden by a scan
+        if error.code != INDEX_NOT_FOUND:
+            raise
+        logger.warning("No text index on %s, run flask ensure-indexes; searching in process", collection.name)
+    scores = text_index(model).search(query)
+    if match and scores:
+        matching = collection.find(dict(match, _id={"$in": list(scores)}), {"_id": 1})
+        scores = {document["_id"]: scores[document["_id"]] for document in matching}
+    return dict(sorted(scores.items(), key=lambda pair: -pair[1])[:MAX_CANDIDATES])
+
+
+def search_wishlists(query: str, customer_id: str = None, is_public: bool = None,
+                     limit: int = 0, offset: int = 0) -> list:
+    """Finds the Wishlists that match a query, best first
+
+    :param customer_id: only search the Wishlists of this customer
+    :param is_public: only search public, or only private, Wishlists
+    :param limit: the most results to return, 0 for no limit
+    :param offset: the number of better results to skip
+    Returns the serialized Wishlists with their Items and a score.
+    """
+    match = {}
+    if customer_id:
+        match["customer_id"] = customer_id
+    if is_public is not None:
+        match["isPublic"] = True if is_public else {"$ne": True}
+
+    scores = defaultdict(float, text_scores(Wishlist, query, match))
+    item_scores = text_scores(Item, query)
+    if item_scores:
+        containing = Wishlist._mongometa.collection.find(
+            dict(match, items={"$in": list(item_scores)}), {"items": 1}
+        ).limit(MAX_CANDIDATES)
+        for document in containing:
+            scores[document["_id"]] += sum(item_scores.get(i, 0) for i in document["items"])
+
+    ranked = sorted(scores.items(), key=lambda pair: (-pair[1], pair[0]))
+    ranked = ranked[offset:offset + limit] if limit else ranked[offset:]
+    documents = {
+        document["_id"]: document
+        for document in Wishlist.find_many([wishlist_id for wishlist_id, _ in ranked]).values()
+    }
+    found = [(documents[wishlist_id], score) for wishlist_id, score in ranked if wishlist_id in documents]
+    results = Wishlist.serialize_documents([document for document, _ in found])
+    for result, (_, score) in zip(results, found):
+        result["score"] = round(score, 4)
+    return results
@@ -84,9 +84,15 @@ $(function () {
 
         $("#flash_message").empty();
 
+        // without a customer id every wishlist is listed
+        let url = "/wishlists";
+        if (wishlist_customerid) {
+            url = `/customers/${encodeURIComponent(wishlist_customerid)}/wishlists`;
+        }
+
         let ajax = $.ajax({
             type: "GET",
-            url: `/wishlists?customer_id=${wishlist_customerid}`,
+            url: url,
             contentType: "application/json",
             data: ''
         })
@@ -0,0 +1,40 @@
+import os
+import runpy
+import unittest
+from unittest.mock import patch
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(__file__)), "gunicorn.conf.py")
+
+
+class TestGunicornConfig(unittest.TestCase):
+    """Test Cases for the worker autotuning"""
+
+    def setUp(self):
+        self.config = runpy.run_path(CONFIG)
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_cpu_bound(self):
+        """Workers follow the CPUs when memory is plentiful"""
+        tuned = self.config["autotune"](cpus=2, memory_mb=4096)
+        self.assertEqual(tuned["worker_class"], "gthread")
+        self.assertEqual(tuned["workers"], 5)
+        self.assertEqual(tuned["threads"], 8)
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_memory_bound(self):
+        """Workers are capped by the memory limit, but there is always one"""
+        self.assertEqual(self.config["autotune"](cpus=4, memory_mb=128)["workers"], 2)
+        self.assertEqual(self.config["autotune"](cpus=4, memory_mb=64)["workers"], 1)
+
+    @patch.dict(os.environ, {"GUNICORN_WORKER_CLASS": "sync", "GUNICORN_WORKERS": "7"}, clear=True)
+    def test_overrides(self):
+        """The environment wins over the autotuning"""
+        tuned = self.config["autotune"](cpus=1)
+        self.assertEqual(tuned["worker_class"], "sync")
+        self.assertEqual(tuned["workers"], 7)
+        self.assertEqual(tuned["threads"], 1)
+
+    @patch.dict(os.environ, {"MEMORY_LIMIT": "1G"}, clear=True)
+    def test_cloud_foundry_memory_limit(self):
+        """MEMORY_LIMIT is read in Cloud Foundry's format"""
+        self.assertEqual(self.config["memory_limit_mb"](), 1024)
@@ -0,0 +1,97 @@
+import io
+import json
+import logging
+import unittest
+from unittest.mock import patch
+
+from service import logs
+
+
+def make_logger(handler, name="tests.logs"):
+    """Returns a logger that only writes to the handler"""
+    logger = logging.Logger(name, logging.DEBUG)
+    logger.addHandler(handler)
+    return logger
+
+
+class TestLogs(unittest.TestCase):
+    """Test Cases for the logging pipeline"""
+
+    def setUp(self):
+        # other test modules turn logging off
+        self.disabled = logging.root.manager.disable
+        logging.disable(logging.NOTSET)
+        self.stream = io.StringIO()
+        with patch.dict("os.environ", {"LOG_MAX_ARG_LENGTH": "20", "LOG_FORMAT": "json"}):
+            self.handler = logs.create_handler(self.stream)
+        self.logger = make_logger(self.handler)
+
+    def tearDown(self):
+        self.handler.stop()
+        logging.disable(self.disabled)
+
+    def lines(self):
+        self.handler.stop()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_json_lines(self):
+        """Records are written as one JSON object per line"""
+        self.logger.info("Created wishlist %s for %d", "books", 42)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            self.logger.exception("Failed")
+        first, second = self.lines()
+        self.assertEqual(first["message"], "Created wishlist books for 42")
+        self.assertEqual(first["level"], "INFO")
+        self.assertEqual(first["logger"], "tests.logs")
+        self.assertIn("ValueError: boom", second["exception"])
+
+    def test_long_arguments_are_shortened(self):
+        """Long arguments are cut to LOG_MAX_ARG_LENGTH"""
+        payload = {"name": "x" * 1000, "items": list(range(1000))}
+        self.logger.info("deserialize(%s)", payload)
+        self.logger.info("body %s", "y" * 100)
+        first, second = self.lines()
+        self.assertLess(len(first["message"]), 300)
+        self.assertIn("...", first["message"])
+        self.assertEqual(second["message"], "body " + "y" * 20 + "...(80 more)")
+
+    def test_arguments_are_rendered_when_logged(self):
+        """Arguments changed after the call do not change the message"""
+        data = {"name": "books"}
+        self.logger.info("%(name)s", data)
+        data["name"] = "games"
+        self.assertEqual(self.lines()[0]["message"], "books")
+
+    def test_sampling(self):
+        """Levels are sampled at their rate"""
+        self.handler.filters[0].rates = logs.parse_rates("DEBUG=0, INFO=0.5")
+        with patch("random.random", side_effect=[0.2, 0.8]):
+            for n in range(2):
+                self.logger.info("info %d", n)
+        self.logger.debug("dropped")
+        self.logger.warning("kept")
+        self.assertEqual([line["message"] for line in self.lines()], ["info 0", "kept"])
+
+    def test_full_queue_drops(self):
+        """Records that do not fit in the queue are counted, not waited on"""
+        handler = logs.QueueLogHandler(logging.StreamHandler(self.stream), queue_size=2)
+        logger = make_logger(handler)
+        with patch.object(logging.handlers.QueueListener, "start"):
+            for n in range(5):
+                logger.info("record %d", n)
+        self.assertEqual(handler.dropped, 3)
+        self.assertEqual(handler.queue.qsize(), 2)
+
+    def test_parse_rates(self):
+        """Sample rates are read per level name"""
+        self.assertEqual(logs.parse_rates(""), {})
+        self.assertEqual(logs.parse_rates("debug=0.01,INFO=1"), {logging.DEBUG: 0.01, logging.INFO: 1.0})
+
+    def test_init_app(self):
+        """The app and module loggers write through one shared handler"""
+        from service import app  # pylint: disable=import-outside-toplevel
+        self.assertIn(logs.handler, app.logger.handlers)
+        self.assertIn(logs.handler, logging.getLogger("flask.app").handlers)
+        self.assertFalse(app.logger.propagate)
@@ -145,6 +145,36 @@ class TestItemModel(unittest.TestCase):
         item = Item()
         self.assertRaises(DataValidationError, item.deserialize, "string data")
 
+    def test_find_an_item(self):
+        """Find Items by id, many at once and with a projection"""
+        Item.objects.all().delete()
+        Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now()).save()
+        Item(item_id=2, item_name='test2', price=100, discount=2, description="test", date_added=datetime.now()).save()
+        item = Item.find(1)
+        self.assertEqual(item.item_name, 'test')
+        self.assertIs(Item.find(3), None)
+        item = Item.find(2, fields=("_id",))
+        self.assertEqual(item.item_id, 2)
+        self.assertIs(item.item_name, None)
+        items = Item.find_many([1, 2, 3])
+        self.assertEqual(sorted(i.item_id for i in items), [1, 2])
+        items = Item.find_many([1], fields=("item_name",))
+        self.assertEqual([i.item_name for i in items], ['test'])
+        self.assertIs(items.first().price, None)
+        Item.objects.all().delete()
+
+    def test_insert_many_items(self):
+        """Insert Items in batches"""
+        Item.objects.all().delete()
+        date = datetime.now().strftime("%m/%d/%Y, %H:%M:%S")
+        records = [{"item_id": i, "item_name": 'test', "price": 100, "discount": 2,
+                    "description": "test", "date_added": date} for i in [1, 2, 3, 1, 4]]
+        results = Item.insert_many(records, batch_size=2)
+        self.assertEqual([r["status"] for r in results], [201, 201, 201, 409, 201])
+        self.assertEqual(results[3]["index"], 3)
+        self.assertEqual(Item.objects.all().count(), 4)
+        Item.objects.all().delete()
+
 class TestWishlists(unittest.TestCase):
     """Test Cases for Wishlist Model"""
 
@@ -197,6 +227,32 @@ class TestWishlists(unittest.TestCase):
         self.assertEqual(wishlists[0].name, "foo2")
         self.assertEqual(wishlists[0].customer_id, "bar")
 
+    def test_wishlist_revisions(self):
+        """Start a new revision on every write"""
+        item = Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now())
+        item.save()
+        wishlist = Wishlist(name="foo", customer_id="bar")
+        self.assertEqual(wishlist.etag, "0")
+        wishlist.save()
+        self.assertEqual(wishlist.revision, 1)
+        self.assertIsNotNone(wishlist.last_modified)
+        self.assertEqual(Wishlist.add_item(wishlist._id, 1).revision, 2)
+        item.delete()
+        self.assertEqual(Wishlist.find(wishlist._id).revision, 3)
+        self.assertEqual(Wishlist.empty(wishlist._id).revision, 4)
+        self.assertIs(Wishlist.empty("2"), None)
+
+    def test_save_if_revision(self):
+        """Save a Wishlist only if it is still at a revision"""
+        wishlist = Wishlist(name="foo", customer_id="bar")
+        wishlist.save()
+        stale = Wishlist.find(wishlist._id)
+        wishlist.name = "foo2"
+        self.assertTrue(wishlist.save_if_revision(1))
+        stale.name = "foo3"
+        self.assertFalse(stale.save_if_revision(1))
+        self.assertEqual(Wishlist.find(wishlist._id).name, "foo2")
+
     def test_delete_a_wishlist(self):
         """Delete a Wishlist"""
         wishlist = Wishlist(name="foo", customer_id="bar")
@@ -237,6 +293,34 @@ class TestWishlists(unittest.TestCase):
         self.assertIn("items", data)
         self.assertEqual(data["items"], [item.serialize()])
 
+    def test_serialize_many_wishlists(self):
+        """Serialize many Wishlists resolving their items at once"""
+        item = Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now())
+        item.save()
+        item2 = Item(item_id=2, item_name='test2', price=100, discount=2, description="test", date_added=datetime.now())
+        item2.save()
+        Wishlist(name="foo", customer_id="bar", items=[item, item2]).save()
+        Wishlist(name="foo2", customer_id="bar", items=[item2]).save()
+        item2.delete()
+        wishlists = Wishlist.find_all()
+        items = Wishlist.resolve_items(wishlists)
+        self.assertEqual(list(items.keys()), [1])
+        data = Wishlist.serialize_many(wishlists)
+        self.assertEqual(len(data), 2)
+        self.assertEqual(data[0]["items"], [item.serialize()])
+        self.assertEqual(data[1]["items"], [])
+
+    def test_serialize_documents(self):
+        """Serialize raw documents the same way as Wishlist instances"""
+        item = Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now())
+        item.save()
+        Wishlist(name="foo", customer_id="bar", items=[item, Item(item_id=2)], isPublic=True).save()
+        Wishlist(name="foo2", customer_id="bar").save()
+        self.assertEqual(Item.serialize_document(Item.objects.values().first()), item.serialize())
+        expected = Wishlist.serialize_many(Wishlist.find_all())
+        self.assertEqual(Wishlist.serialize_documents(Wishlist.find_all().values()), expected)
+        self.assertEqual(list(Wishlist.serialize_stream(Wishlist.find_all().values(), batch_size=1)), expected)
+
     def test_deserialize_a_wishlist(self):
         """Deserialize a Wishlist"""
         item = Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now())
@@ -284,6 +368,51 @@ class TestWishlists(unittest.TestCase):
         wishlist = Wishlist(None, "cat")
         self.assertRaises(ValidationError, wishlist.save)
 
+    def test_add_and_remove_item(self):
+        """Add and remove Items from a Wishlist atomically"""
+        item = Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now())
+        item.save()
+        wishlist = Wishlist(name="foo", customer_id="bar", isPublic=True)
+        wishlist.save()
+        updated = Wishlist.add_item(wishlist._id, 1)
+        self.assertEqual(updated.item_ids(), [1])
+        updated = Wishlist.add_item(wishlist._id, 1)
+        self.assertEqual(updated.item_ids(), [1])
+        updated = Wishlist.remove_item(wishlist._id, 1)
+        self.assertEqual(updated.item_ids(), [])
+        self.assertTrue(updated.isPublic)
+        self.assertIs(Wishlist.remove_item(wishlist._id, 1), None)
+        self.assertIs(Wishlist.add_item(ObjectId(), 1), None)
+        self.assertIs(Wishlist.add_item("2", 1), None)
+        self.assertIs(Wishlist.remove_item("2", 1), None)
+
+    def test_pull_item(self):
+        """Remove an Item from every Wishlist that contains it"""
+        item = Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now())
+        item.save()
+        containing = [Wishlist(name=name, customer_id="bar", items=[item]) for name in ("foo", "baz")]
+        for wishlist in containing:
+            wishlist.save()
+        other = Wishlist(name="qux", customer_id="bar")
+        other.save()
+        self.assertEqual(sorted(w.name for w in Wishlist.find_by_item(1)), ["baz", "foo"])
+        self.assertEqual(Wishlist.pull_item(1), 2)
+        self.assertEqual(Wishlist.find_by_item(1).count(), 0)
+        self.assertEqual(Wishlist.find(containing[0]._id).revision, containing[0].revision + 1)
+        self.assertEqual(Wishlist.find(other._id).revision, other.revision)
+        self.assertEqual(Wishlist.pull_item(1), 0)
+
+    def test_prune_items(self):
+        """Remove the references to Items that no longer exist"""
+        item = Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now())
+        item.save()
+        wishlist = Wishlist(name="foo", customer_id="bar", items=[item])
+        wishlist.save()
+        Wishlist._mongometa.collection.update_one({"_id": wishlist._id}, {"$push": {"items": 2}})
+        self.assertEqual(Wishlist.prune_items(), 1)
+        self.assertEqual(Wishlist.find(wishlist._id).item_ids(), [1])
+        self.assertEqual(Wishlist.prune_items(), 0)
+
     def test_find_wishlist(self):
         """Find a Wishlist by id"""
         saved_wishlist = Wishlist("foo", "bar")
@@ -293,6 +422,25 @@ class TestWishlists(unittest.TestCase):
         self.assertEqual(wishlist._id, saved_wishlist._id)
         self.assertEqual(wishlist.name, "foo")
 
+    def test_find_wishlist_fields(self):
+        """Find a Wishlist loading only some fields"""
+        saved_wishlist = Wishlist("foo", "bar")
+        saved_wishlist.save()
+        wishlist = Wishlist.find(saved_wishlist._id, fields=("_id",))
+        self.assertEqual(wishlist._id, saved_wishlist._id)
+        self.assertIs(wishlist.name, None)
+
+    def test_find_many_wishlists(self):
+        """Find many Wishlists by id"""
+        wishlist = Wishlist("foo", "bar")
+        wishlist.save()
+        wishlist2 = Wishlist("foo2", "bar")
+        wishlist2.save()
+        wishlists = Wishlist.find_many([wishlist._id, str(wishlist2._id), "invalid", ObjectId()])
+        self.assertEqual(sorted(w.name for w in wishlists), ["foo", "foo2"])
+        wishlists = Wishlist.find_many([wishlist._id], fields=("name",))
+        self.assertIs(wishlists.first().customer_id, None)
+
     def test_find_with_no_wishlists(self):
         """Find a Wishlist with empty database"""
         wishlist = Wishlist.find(ObjectId())
@@ -336,6 +484,17 @@ class TestWishlists(unittest.TestCase):
         for wishlist in wishlists:
             self.assertEqual(wishlist.customer_id, saved_wishlist.customer_id)
 
+    def test_find_resolved_by_customer_id(self):
+        """Find the Wishlists of a customer with their Items joined in"""
+        item = Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now())
+        item.save()
+        Wishlist(name="foo", customer_id="bar", items=[item, Item(item_id=2)], isPublic=True).save()
+        Wishlist(name="foo2", customer_id="bar").save()
+        Wishlist(name="other", customer_id="baz").save()
+        expected = Wishlist.serialize_many(Wishlist.find_by_customer_id("bar").order_by([("_id", 1)]))
+        self.assertEqual(Wishlist.find_resolved_by_customer_id("bar"), expected)
+        self.assertEqual(Wishlist.find_resolved_by_customer_id("nobody"), [])
+
     def test_find_by_cutomer_id_with_no_wishlists(self):
         """Find a Wishlist with empty database"""
         wishlists = Wishlist.find_by_customer_id("bar")
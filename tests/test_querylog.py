@@ -0,0 +1,96 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from service.querylog import QueryLog, summarize_plan
+
+COLLSCAN_PLAN = {
+    "queryPlanner": {"winningPlan": {"stage": "COLLSCAN", "filter": {"name": {"$eq": "books"}}}},
+    "executionStats": {"nReturned": 1, "totalDocsExamined": 5000, "totalKeysExamined": 0},
+}
+INDEX_PLAN = {
+    "queryPlanner": {
+        "winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "name_1"}},
+        "rejectedPlans": [{"stage": "COLLSCAN"}],
+    },
+    "executionStats": {"nReturned": 1, "totalDocsExamined": 1, "totalKeysExamined": 1},
+}
+
+
+def read(name="find", duration_ms=1, request_id=1):
+    """Returns the started and succeeded events of a find on wishlist"""
+    started = SimpleNamespace(
+        command_name=name, connection_id=("localhost", 27017), request_id=request_id,
+        database_name="wishlists", command={name: "wishlist", "filter": {"name": "books"}},
+    )
+    succeeded = SimpleNamespace(
+        command_name=name, connection_id=("localhost", 27017), request_id=request_id,
+        duration_micros=duration_ms * 1000,
+    )
+    return started, succeeded
+
+
+class TestQueryLog(unittest.TestCase):
+    """Test Cases for the slow query log"""
+
+    def run_read(self, query_log, **kwargs):
+        started, succeeded = read(**kwargs)
+        query_log.started(started)
+        query_log.succeeded(succeeded)
+        query_log.drain()
+
+    def test_summarize_plan(self):
+        """Collection scans are only flagged in the winning plan"""
+        self.assertTrue(summarize_plan(COLLSCAN_PLAN)["collscan"])
+        self.assertEqual(summarize_plan(COLLSCAN_PLAN)["docs_examined"], 5000)
+        plan = summarize_plan(INDEX_PLAN)
+        self.assertFalse(plan["collscan"])
+        self.assertEqual(plan["stages"], ["FETCH", "IXSCAN"])
+
+    def test_fast_reads_are_ignored(self):
+        """Reads under the threshold are neither logged nor explained"""
+        explainer = Mock(return_value=COLLSCAN_PLAN)
+        query_log = QueryLog(slow_ms=100, explainer=explainer)
+        with patch.object(query_log, "log") as log:
+            self.run_read(query_log, duration_ms=5)
+        log.assert_not_called()
+        explainer.assert_not_called()
+
+    def test_slow_read_is_explained(self):
+        """Slow reads are logged with what they examined"""
+        query_log = QueryLog(slow_ms=100, explainer=lambda database, command: COLLSCAN_PLAN)
+        with patch.object(query_log, "log") as log:
+            self.run_read(query_log, duration_ms=250)
+        self.assertEqual(query_log.slow_queries, 1)
+        self.assertEqual(query_log.collscans, 1)
+        database, command, duration_ms, slow, plan = log.call_args[0]
+        self.assertEqual(command["filter"], {"name": "books"})
+        self.assertEqual(duration_ms, 250)
+        self.assertEqual(plan["docs_examined"], 5000)
+
+    def test_slow_read_without_explain(self):
+        """Slow reads are logged right away when explaining them is off"""
+        explainer = Mock()
+        query_log = QueryLog(slow_ms=100, explain_slow=False, explainer=explainer)
+        with patch.object(query_log, "log") as log:
+            self.run_read(query_log, duration_ms=250)
+        log.assert_called_once()
+        explainer.assert_not_called()
+
+    def test_sampled_collscan(self):
+        """Sampled reads are only logged when they scan the collection"""
+        query_log = QueryLog(slow_ms=100, sample_rate=1, explainer=lambda database, command: INDEX_PLAN)
+        with patch.object(query_log, "log") as log:
+            self.run_read(query_log, duration_ms=5)
+            log.assert_not_called()
+            query_log.explainer = lambda database, command: COLLSCAN_PLAN
+            self.run_read(query_log, duration_ms=5, request_id=2)
+        log.assert_called_once()
+        self.assertEqual(query_log.collscans, 1)
+
+    def test_writes_are_ignored(self):
+        """Only reads are watched"""
+        query_log = QueryLog(slow_ms=0, explainer=Mock())
+        with patch.object(query_log, "log") as log:
+            self.run_read(query_log, name="insert", duration_ms=500)
+        log.assert_not_called()
@@ -1,10 +1,13 @@
+import gzip
+import json
 import logging
 import os
 from datetime import datetime
 from unittest import TestCase
+from unittest.mock import patch
 
 from pymodm.connection import connect
-from service import routes, status, error_handlers
+from service import app, status
 from service.models import DataValidationError, Item, Wishlist
 from werkzeug.datastructures import ImmutableMultiDict, MultiDict
 
@@ -24,7 +27,7 @@ class TestWishlistServer(TestCase):
 
     @classmethod
     def setUp(self):
-        self.app = routes.app.test_client()
+        self.app = app.test_client()
         connect(DATABASE_URI.replace('wishlists?','testwishlist?'))
         Wishlist.objects.all().delete()
         Item.objects.all().delete()
@@ -221,6 +224,95 @@ class TestWishlistServer(TestCase):
         data1 = resp1.get_json()
         print(data1)
 
+    def test_get_wishlist_list_paginated(self):
+        """Page through wishlists with a limit and an after cursor"""
+        for name in ["a", "b", "c"]:
+            Wishlist(name=name, customer_id="cust_1").save()
+        resp = self.app.get("/wishlists?limit=2")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual([w["name"] for w in data], ["a", "b"])
+        self.assertIn('rel="next"', resp.headers["Link"])
+        next_url = resp.headers["Link"].split(">")[0].lstrip("<")
+        resp = self.app.get(next_url)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([w["name"] for w in resp.get_json()], ["c"])
+        self.assertNotIn("Link", resp.headers)
+
+    def test_get_wishlist_list_bad_cursor(self):
+        """Page through wishlists with an invalid cursor"""
+        resp = self.app.get("/wishlists?limit=2&after=bad")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.get("/wishlists?limit=-1")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.get("/items?after=bad")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stream_wishlist_list(self):
+        """Stream wishlists as NDJSON"""
+        item = Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now())
+        item.save()
+        Wishlist(name="fruits", customer_id="customer_a", items=[item]).save()
+        Wishlist(name="music", customer_id="customer_b").save()
+        resp = self.app.get("/wishlists", headers={"Accept": "application/x-ndjson"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.mimetype, "application/x-ndjson")
+        lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]["items"], [item.serialize()])
+
+    def test_export_wishlists(self):
+        """Export all wishlists as plain and gzip compressed NDJSON"""
+        Wishlist(name="fruits", customer_id="customer_a").save()
+        Wishlist(name="music", customer_id="customer_b").save()
+        resp = self.app.get("/wishlists:export")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.mimetype, "application/x-ndjson")
+        names = [json.loads(line)["name"] for line in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual(names, ["fruits", "music"])
+        resp = self.app.get("/wishlists:export", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertEqual(len(gzip.decompress(resp.data).splitlines()), 2)
+
+    def test_list_customer_wishlists(self):
+        """List the wishlists of a customer with their items"""
+        item = Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now())
+        item.save()
+        Wishlist(name="fruits", customer_id="customer_a", items=[item]).save()
+        Wishlist(name="music", customer_id="customer_b").save()
+        resp = self.app.get("/customers/customer_a/wishlists")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual([wishlist["name"] for wishlist in data], ["fruits"])
+        self.assertEqual(data[0]["items"], [item.serialize()])
+        resp = self.app.get("/customers/nobody/wishlists")
+        self.assertEqual(resp.get_json(), [])
+        # ids are URL encoded by the UI
+        Wishlist(name="books", customer_id="a/b?c#d").save()
+        resp = self.app.get("/customers/a%2Fb%3Fc%23d/wishlists")
+        self.assertEqual([wishlist["name"] for wishlist in resp.get_json()], ["books"])
+
+    def test_search_wishlists(self):
+        """Search wishlists by name and by their items, a page at a time"""
+        item = Item(item_id=1, item_name='guitar', price=100, discount=2, description="test", date_added=datetime.now())
+        item.save()
+        Wishlist(name="music", customer_id="customer_a", items=[item]).save()
+        Wishlist(name="guitar picks", customer_id="customer_b", isPublic=True).save()
+        Wishlist(name="fruits", customer_id="customer_b").save()
+        resp = self.app.get("/wishlists:search?q=guitar&limit=1")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(len(data), 1)
+        self.assertIn("score", data[0])
+        next_url = resp.headers["Link"].split(">")[0].lstrip("<")
+        resp = self.app.get(next_url)
+        self.assertEqual(len(resp.get_json()), 1)
+        self.assertNotEqual(resp.get_json()[0]["name"], data[0]["name"])
+        resp = self.app.get("/wishlists:search?q=guitar&isPublic=true")
+        self.assertEqual([w["name"] for w in resp.get_json()], ["guitar picks"])
+        resp = self.app.get("/wishlists:search")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_add_item_to_wishlist(self):
         """Add item to Wishlist"""
 
@@ -253,6 +345,28 @@ class TestWishlistServer(TestCase):
 
 
 
+    def test_add_item_to_wishlist_not_found(self):
+        """Add an item to a Wishlist that does not exist"""
+        item = Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now())
+        item.save()
+        resp = self.app.post(
+            "{0}/{1}/items".format(BASE_URL, ObjectId()), content_type=CONTENT_TYPE_JSON, json={"item_id":1}
+        )
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        wishlist = Wishlist(name="foo", customer_id="bar")
+        wishlist.save()
+        resp = self.app.post(
+            "{0}/{1}/items".format(BASE_URL, wishlist._id), content_type=CONTENT_TYPE_JSON, json={"item_id":2}
+        )
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_delete_item_from_missing_wishlist(self):
+        """Delete an item from a Wishlist that does not exist"""
+        resp = self.app.delete(
+            "{0}/{1}/items/1".format(BASE_URL, ObjectId()), content_type=CONTENT_TYPE_JSON
+        )
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_delete_single_item_from_wishlist(self):
         """Delete item from Wishlist"""
 
@@ -352,6 +466,117 @@ class TestWishlistServer(TestCase):
         self.assertEqual(data["name"], "Planes")
         self.assertEqual(data["customer_id"], "user123")
 
+    def test_read_wishlist_is_cached_until_written(self):
+        """Serve a Wishlist from the cache until it changes"""
+        item = Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now())
+        item.save()
+        wishlist = Wishlist(name="Planes", customer_id="user123")
+        wishlist.save()
+        url = '{}/{}'.format(BASE_URL, wishlist._id)
+        hits = self.app.get("/cache/stats").get_json()["hits"]
+        self.assertEqual(self.app.get(url).get_json()["name"], "Planes")
+        self.assertEqual(self.app.get(url).get_json()["name"], "Planes")
+        self.assertEqual(self.app.get("/cache/stats").get_json()["hits"], hits + 2)
+
+        resp = self.app.put(url, json={"name": "Trains", "customer_id": "user123"}, content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.app.get(url).get_json()["name"], "Trains")
+
+        self.app.post(url + "/items", json={"item_id": 1}, content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(len(self.app.get(url + "/items").get_json()), 1)
+        self.app.delete("/items/1")
+        self.assertEqual(self.app.get(url + "/items").get_json(), [])
+
+        self.app.put(url + "/public", content_type=CONTENT_TYPE_JSON)
+        self.assertTrue(self.app.get(url).get_json()["isPublic"])
+        self.app.delete(url)
+        self.assertEqual(self.app.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_pool_stats(self):
+        """Report the connection pool of this worker"""
+        resp = self.app.get("/pool/stats")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()["pid"], os.getpid())
+
+    def test_read_wishlist_not_modified(self):
+        """Answer a conditional GET with 304 until the Wishlist changes"""
+        wishlist = Wishlist(name="Planes", customer_id="user123")
+        wishlist.save()
+        url = '{}/{}'.format(BASE_URL, wishlist._id)
+        resp = self.app.get(url)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        etag = resp.headers["ETag"]
+        self.assertIn("Last-Modified", resp.headers)
+
+        resp = self.app.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(resp.data, b"")
+        resp = self.app.get(url + "/items", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.app.put(url + "/public", content_type=CONTENT_TYPE_JSON)
+        resp = self.app.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+        self.assertTrue(resp.get_json()["isPublic"])
+
+    def test_update_wishlist_if_match(self):
+        """Update a Wishlist only if it was not changed in between"""
+        wishlist = Wishlist(name="Planes", customer_id="user123")
+        wishlist.save()
+        url = '{}/{}'.format(BASE_URL, wishlist._id)
+        etag = self.app.get(url).headers["ETag"]
+        body = {"name": "Trains", "customer_id": "user123"}
+
+        resp = self.app.put(url, json=body, content_type=CONTENT_TYPE_JSON, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+
+        body["name"] = "Boats"
+        resp = self.app.put(url, json=body, content_type=CONTENT_TYPE_JSON, headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(Wishlist.find(wishlist._id).name, "Trains")
+
+        resp = self.app.put(url, json=body, content_type=CONTENT_TYPE_JSON, headers={"If-Match": '"bad"'})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        resp = self.app.put(url, json=body, content_type=CONTENT_TYPE_JSON, headers={"If-Match": "*"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    def test_writes_ignore_stale_cached_copies(self):
+        """Writes apply to the stored Wishlist, not to a stale cached copy"""
+        item = Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now())
+        item.save()
+        wishlist = Wishlist(name="Planes", customer_id="user123")
+        wishlist.save()
+        url = '{}/{}'.format(BASE_URL, wishlist._id)
+        self.assertEqual(self.app.get(url).get_json()["items"], [])
+        # another instance adds an Item, this instance's cache is not told
+        Wishlist._mongometa.collection.update_one(
+            {"_id": wishlist._id}, {"$push": {"items": 1}, "$inc": {"revision": 1}}
+        )
+        resp = self.app.put(url + "/public", content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        document = Wishlist._mongometa.collection.find_one({"_id": wishlist._id})
+        self.assertEqual(document["items"], [1])
+        self.assertTrue(document["isPublic"])
+        self.assertEqual(document["revision"], wishlist.revision + 2)
+
+        resp = self.app.put(url, json={"name": "Trains", "customer_id": "user123", "items": [item.serialize()]},
+                            content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(Wishlist.find(wishlist._id, cached=False).revision, wishlist.revision + 3)
+
+    def test_update_wishlist_conflict(self):
+        """Give up on an update that keeps losing races with other writes"""
+        wishlist = Wishlist(name="Planes", customer_id="user123")
+        wishlist.save()
+        url = '{}/{}'.format(BASE_URL, wishlist._id)
+        with patch.object(Wishlist, "save_if_revision", return_value=False) as save_if_revision:
+            resp = self.app.put(url, json={"name": "Trains", "customer_id": "user123"}, content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(save_if_revision.call_count, 3)
+        self.assertEqual(Wishlist.find(wishlist._id).name, "Planes")
+
     def test_read_wishlist_not_found(self):
         
         id_val = str(ObjectId())
@@ -412,6 +637,72 @@ class TestWishlistServer(TestCase):
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
         self.assertEqual(resp.get_json()[0], item)
 
+    def test_list_items_paginated(self):
+        """Page through items and stream them as NDJSON"""
+        for item_id in [3, 1, 2]:
+            Item(item_id=item_id, item_name='test', price=100, discount=2, description="test", date_added=datetime.now()).save()
+        resp = self.app.get("/items?limit=2&after=1")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([i["item_id"] for i in resp.get_json()], [2, 3])
+        self.assertIn("after=3", resp.headers["Link"])
+        resp = self.app.get("/items", headers={"Accept": "application/x-ndjson"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(resp.get_data(as_text=True).splitlines()), 3)
+
+    def test_bulk_create_items(self):
+        """Create many items from a JSON array"""
+        Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now()).save()
+        item = {"item_id":2, "item_name": "test", "price": 0, "discount":0, "description":"test", "date_added": "04/02/2022, 12:45:00"}
+        records = [item, dict(item, item_id=3), dict(item, item_id=1), dict(item, date_added="bad"), dict(item, item_id=2)]
+        resp = self.app.post("/items:bulk", json=records, content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(data["created"], 2)
+        self.assertEqual(data["failed"], 3)
+        self.assertEqual([r["status"] for r in data["results"]], [201, 201, 409, 400, 409])
+        self.assertEqual(data["results"][1]["id"], 3)
+        self.assertIn("error", data["results"][2])
+        self.assertEqual(Item.find(3).serialize(), dict(item, item_id=3))
+
+    def test_bulk_create_wishlists_ndjson(self):
+        """Create many wishlists from an NDJSON stream"""
+        lines = [
+            json.dumps({"name": "fruits", "customer_id": "customer_a"}),
+            "not json",
+            json.dumps({"customer_id": "customer_b"}),
+            json.dumps({"name": "music", "customer_id": "customer_b", "isPublic": True}),
+        ]
+        resp = self.app.post("/wishlists:bulk", data="\n".join(lines) + "\n", content_type="application/x-ndjson")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual([r["status"] for r in data["results"]], [201, 400, 400, 201])
+        wishlist = Wishlist.find(data["results"][3]["id"])
+        self.assertEqual(wishlist.name, "music")
+        self.assertEqual(wishlist.revision, 1)
+
+    def test_bulk_create_wishlists_bad_ids(self):
+        """Records with malformed ids are rejected one by one"""
+        records = [
+            {"name": "fruits", "customer_id": "customer_a"},
+            {"name": "music", "customer_id": "customer_b", "_id": "bad"},
+            {"name": "books", "customer_id": "customer_b", "_id": 5},
+            {"name": "films", "customer_id": "customer_c", "_id": str(ObjectId())},
+        ]
+        resp = self.app.post("/wishlists:bulk", json=records, content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual([r["status"] for r in data["results"]], [201, 400, 400, 201])
+        self.assertIn("_id", data["results"][1]["error"])
+        self.assertEqual(data["results"][3]["id"], records[3]["_id"])
+        self.assertEqual(Wishlist.objects.count(), 2)
+
+    def test_bulk_create_bad_payload(self):
+        """Create in bulk with a payload that is not a list"""
+        resp = self.app.post("/wishlists:bulk", json={"name": "x"}, content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.post("/items:bulk", data="x", content_type="plain/text")
+        self.assertEqual(resp.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
     def test_delete_an_item(self):
         """Delete an item"""
         item = {"item_id":1, "item_name": "test", "price": 0, "discount":0, "description":"test", "date_added": "04/02/2022, 12:45:00"}
@@ -429,6 +720,41 @@ class TestWishlistServer(TestCase):
         resp = self.app.delete("/items/{}".format(item["item_id"]))
         self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
 
+    def test_list_item_wishlists(self):
+        """List the wishlists that contain an item"""
+        item = Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now())
+        item.save()
+        wishlists = [Wishlist(name=name, customer_id="user123", items=[item]) for name in ("Planes", "Trains")]
+        for wishlist in wishlists:
+            wishlist.save()
+        Wishlist(name="Cars", customer_id="user123").save()
+        resp = self.app.get("/items/1/wishlists")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(w["name"] for w in resp.get_json()), ["Planes", "Trains"])
+        self.assertEqual(resp.get_json()[0]["items"][0]["item_id"], 1)
+        resp = self.app.get("/items/1/wishlists?limit=1")
+        self.assertIn("/items/1/wishlists?", resp.headers["Link"])
+        self.assertIn("after={}".format(resp.get_json()[0]["_id"]), resp.headers["Link"])
+        resp = self.app.get("/items/2/wishlists")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_delete_an_item_from_its_wishlists(self):
+        """Deleting an item removes it from every wishlist that contains it"""
+        item = Item(item_id=1, item_name='test', price=100, discount=2, description="test", date_added=datetime.now())
+        item.save()
+        wishlist = Wishlist(name="Planes", customer_id="user123", items=[item])
+        wishlist.save()
+        url = '{}/{}'.format(BASE_URL, wishlist._id)
+        etag = self.app.get(url).headers["ETag"]
+        resp = self.app.delete("/items/1")
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        document = Wishlist._mongometa.collection.find_one({"_id": wishlist._id})
+        self.assertEqual(document["items"], [])
+        self.assertEqual(document["revision"], wishlist.revision + 1)
+        resp = self.app.get(url)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+        self.assertEqual(resp.get_json()["items"], [])
+
     def test_create_existing_item(self):
         """Create an Item with existing id"""
 